@@ -0,0 +1,55 @@
+"""
+Сохранение результатов как baseline и сравнение нового прогона с ним.
+"""
+import json
+import os
+import platform
+from datetime import datetime
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+
+def baseline_path(name: str) -> str:
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def save(name: str, results: list[dict], params: dict) -> str:
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    path = baseline_path(name)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({
+            "created_at": datetime.utcnow().isoformat(),
+            "machine": platform.platform(),
+            "python": platform.python_version(),
+            "params": params,
+            "results": results,
+        }, f, indent=2, ensure_ascii=False)
+    return path
+
+
+def load(name: str) -> dict:
+    with open(baseline_path(name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(baseline: dict, results: list[dict], tolerance: float) -> list[str]:
+    """Регрессии относительно baseline: рост p95 или падение rps больше tolerance."""
+    previous = {row["endpoint"]: row for row in baseline["results"]}
+    regressions = []
+    for row in results:
+        before = previous.get(row["endpoint"])
+        if before is None:
+            continue
+        if before["p95_ms"] and row["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{row['endpoint']}: p95 {before['p95_ms']:.2f}ms -> {row['p95_ms']:.2f}ms"
+            )
+        if before["rps"] and row["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(
+                f"{row['endpoint']}: rps {before['rps']:.1f} -> {row['rps']:.1f}"
+            )
+        if row["errors"] > before["errors"]:
+            regressions.append(
+                f"{row['endpoint']}: errors {before['errors']} -> {row['errors']}"
+            )
+    return regressions
@@ -0,0 +1,140 @@
+"""
+Micro-benchmark of the CRUD write paths of both services: SQL statements
+issued and latency per operation, each operation in a fresh session as in a
+request.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_crud [-n 1000]
+"""
+import argparse
+import shutil
+import statistics
+import sys
+import time
+
+from benchmarks.settings import configure_apps, make_workdir
+
+_TMP_DIR = make_workdir("bench_crud_")
+# The benchmark binds its own sessions to these throwaway files
+configure_apps(f"{_TMP_DIR}/todo.db", f"{_TMP_DIR}/shorturl.db")
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from todo_app.app import crud as todo_crud, models as todo_models, schemas as todo_schemas
+from shorturl_app.app import crud as shorturl_crud, models as shorturl_models
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def measure(name, session_factory, counter, operation, n):
+    timings = []
+    statements = 0
+    for i in range(n):
+        db = session_factory()
+        try:
+            counter.count = 0
+            started = time.perf_counter()
+            operation(db, i)
+            timings.append(time.perf_counter() - started)
+            statements += counter.count
+        finally:
+            db.close()
+
+    timings.sort()
+    return {
+        "operation": name,
+        "statements": statements / n,
+        "mean_us": statistics.fmean(timings) * 1e6,
+        "p50_us": timings[len(timings) // 2] * 1e6,
+        "p95_us": timings[int(len(timings) * 0.95) - 1] * 1e6,
+    }
+
+
+def bench_todo(n):
+    engine = create_engine(f"sqlite:///{_TMP_DIR}/todo.db", connect_args={"check_same_thread": False})
+    todo_models.Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine, autoflush=False)
+    counter = StatementCounter(engine)
+
+    db = session_factory()
+    user = todo_models.User(username="bench", email="bench@example.com", hashed_password="-")
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+
+    item_ids = []
+
+    def create(db, i):
+        item = todo_schemas.TodoItemCreate(title=f"Задача {i}", description="benchmark")
+        item_ids.append(todo_crud.create_todo_item(db, item, user_id).id)
+
+    def update(db, i):
+        item_update = todo_schemas.TodoItemUpdate(completed=i % 2 == 0, title=f"Задача {i}*")
+        todo_crud.update_todo_item(db, item_ids[i], item_update, user_id)
+
+    def delete(db, i):
+        todo_crud.delete_todo_item(db, item_ids[i], user_id)
+
+    return [
+        measure("todo.create_todo_item", session_factory, counter, create, n),
+        measure("todo.update_todo_item", session_factory, counter, update, n),
+        measure("todo.delete_todo_item", session_factory, counter, delete, n),
+    ]
+
+
+def bench_shorturl(n):
+    engine = create_engine(f"sqlite:///{_TMP_DIR}/shorturl.db", connect_args={"check_same_thread": False})
+    shorturl_models.Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine, autoflush=False)
+    counter = StatementCounter(engine)
+
+    short_ids = []
+
+    def create(db, i):
+        short_ids.append(shorturl_crud.create_short_url(db, f"https://example.com/{i}").short_id)
+
+    def redirect(db, i):
+        shorturl_crud.resolve_short_id(db, short_ids[i])
+
+    def delete(db, i):
+        shorturl_crud.delete_url(db, short_ids[i])
+
+    return [
+        measure("shorturl.create_short_url", session_factory, counter, create, n),
+        measure("shorturl.resolve_short_id", session_factory, counter, redirect, n),
+        measure("shorturl.delete_url", session_factory, counter, delete, n),
+    ]
+
+
+def print_report(results, out=sys.stdout):
+    print(f"{'operation':<28}{'stmts/op':>10}{'mean us':>12}{'p50 us':>12}{'p95 us':>12}", file=out)
+    for row in results:
+        print(
+            f"{row['operation']:<28}{row['statements']:>10.2f}"
+            f"{row['mean_us']:>12.1f}{row['p50_us']:>12.1f}{row['p95_us']:>12.1f}",
+            file=out
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", type=int, default=1000, help="operations per benchmark")
+    args = parser.parse_args(argv)
+
+    try:
+        print_report(bench_todo(args.n) + bench_shorturl(args.n))
+    finally:
+        shutil.rmtree(_TMP_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Cost of producing the /items/ response body per 1,000 items: the ORM +
+Pydantic path against the FAST_JSON path (plain rows + FastJSONResponse).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_serialization [--items 1000] [--repeat 50]
+"""
+import argparse
+import shutil
+import statistics
+import time
+
+from benchmarks.settings import configure_apps, make_workdir
+
+_TMP_DIR = make_workdir("bench_serialization_")
+# The benchmark binds its own sessions to these throwaway files
+configure_apps(f"{_TMP_DIR}/todo.db", f"{_TMP_DIR}/shorturl.db")
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from todo_app.app import crud, models, schemas
+from common.responses import FastJSONResponse, orjson
+
+ITEMS_ADAPTER = TypeAdapter(list[schemas.TodoItem])
+
+
+def pydantic_jsonable(db, user_id, limit):
+    """Как FastAPI до прямой сериализации: валидация, jsonable_encoder, json.dumps."""
+    items = ITEMS_ADAPTER.validate_python(crud.get_todo_items(db, user_id, limit=limit), from_attributes=True)
+    return JSONResponse(jsonable_encoder(items)).body
+
+
+def pydantic_dump_json(db, user_id, limit):
+    """Как современный FastAPI с response_model: валидация и dump_json в Rust."""
+    items = ITEMS_ADAPTER.validate_python(crud.get_todo_items(db, user_id, limit=limit), from_attributes=True)
+    return ITEMS_ADAPTER.dump_json(items)
+
+
+def fast_json_rows(db, user_id, limit):
+    """FAST_JSON: только нужные колонки строками и FastJSONResponse."""
+    rows = crud.get_todo_item_rows(db, user_id, limit=limit)
+    return FastJSONResponse([row._asdict() for row in rows]).body
+
+
+def seed(session_factory, items):
+    db = session_factory()
+    user = models.User(username="bench", email="bench@example.com", hashed_password="-")
+    db.add(user)
+    db.commit()
+    crud.bulk_create_todo_items(db, [
+        schemas.TodoItemCreate(title=f"Задача {i}", description="Описание " * 5, completed=i % 3 == 0)
+        for i in range(items)
+    ], user.id)
+    user_id = user.id
+    db.close()
+    return user_id
+
+
+def run(path, session_factory, user_id, items, repeat):
+    timings = []
+    for _ in range(repeat):
+        db = session_factory()
+        try:
+            started = time.perf_counter()
+            body = path(db, user_id, items)
+            timings.append(time.perf_counter() - started)
+        finally:
+            db.close()
+    return statistics.median(timings) * 1000 * (1000 / items), len(body)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=1000, help="items per response")
+    parser.add_argument("--repeat", type=int, default=50, help="measured responses per path")
+    args = parser.parse_args(argv)
+
+    try:
+        engine = create_engine(f"sqlite:///{_TMP_DIR}/todo.db", connect_args={"check_same_thread": False})
+        models.Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(bind=engine, autoflush=False)
+        user_id = seed(session_factory, args.items)
+
+        print(f"encoder: {'orjson' if orjson is not None else 'json (orjson not installed)'}")
+        print(f"{'path':<22}{'ms / 1000 items':>18}{'body bytes':>14}")
+        for path in (pydantic_jsonable, pydantic_dump_json, fast_json_rows):
+            warm_up = session_factory()
+            path(warm_up, user_id, args.items)
+            warm_up.close()
+            ms, size = run(path, session_factory, user_id, args.items, args.repeat)
+            print(f"{path.__name__:<22}{ms:>18.2f}{size:>14}")
+    finally:
+        shutil.rmtree(_TMP_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Генератор нагрузки: конкурентные клиенты против ASGI-приложения в процессе
+(httpx.ASGITransport) или против локального uvicorn по HTTP.
+
+Каждый сценарий — один эндпоинт; он гоняется отдельно `concurrency`
+клиентами в течение `duration` секунд, латентность меряется на клиенте.
+"""
+import asyncio
+import itertools
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+
+from benchmarks.seed import BENCH_PASSWORD, short_id_for, username_for
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Scenario:
+    def __init__(self, name: str, service: str, request, expected_status=(200,)):
+        self.name = name
+        self.service = service
+        self.request = request
+        self.expected_status = expected_status
+
+
+class Context:
+    """Что сценариям нужно знать о засеянных данных."""
+
+    def __init__(self, links: int, users: int, tokens=None, item_ids=None):
+        self.links = links
+        self.users = users
+        self.tokens = tokens or {}
+        self.item_ids = item_ids or {}
+        self._counter = itertools.count()
+
+    def next(self) -> int:
+        return next(self._counter)
+
+    def random_user(self) -> int:
+        return random.randrange(self.users)
+
+    def auth_headers(self, user: int) -> dict:
+        return {"Authorization": f"Bearer {self.tokens[user]}"}
+
+
+async def _redirect(client, ctx):
+    return await client.get(f"/{short_id_for(random.randrange(ctx.links))}")
+
+
+async def _shorten(client, ctx):
+    return await client.post("/shorten", json={"url": f"https://example.com/new/{os.getpid()}/{ctx.next()}"})
+
+
+async def _auth(client, ctx):
+    return await client.post("/auth", json={"username": username_for(ctx.random_user()), "password": BENCH_PASSWORD})
+
+
+async def _item_list(client, ctx):
+    user = ctx.random_user()
+    return await client.get("/items/", params={"limit": 100}, headers=ctx.auth_headers(user))
+
+
+async def _item_update(client, ctx):
+    user = ctx.random_user()
+    item_id = random.choice(ctx.item_ids[user])
+    return await client.put(
+        f"/items/{item_id}",
+        json={"completed": bool(ctx.next() % 2)},
+        headers=ctx.auth_headers(user)
+    )
+
+
+SCENARIOS = {
+    scenario.name: scenario for scenario in (
+        Scenario("redirect", "shorturl", _redirect, expected_status=(302, 307)),
+        Scenario("shorten", "shorturl", _shorten),
+        Scenario("auth", "todo", _auth),
+        Scenario("item_list", "todo", _item_list),
+        Scenario("item_update", "todo", _item_update),
+    )
+}
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def run_scenario(client, scenario: Scenario, ctx: Context, concurrency: int, duration: float) -> dict:
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await scenario.request(client, ctx)
+                ok = response.status_code in scenario.expected_status
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "endpoint": scenario.name,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def prepare_todo_context(client, ctx: Context, todo_db: str) -> None:
+    """Токены и id задач для сценариев todo: логин каждого пользователя и выборка задач."""
+    for user in range(ctx.users):
+        response = await client.post("/auth", json={"username": username_for(user), "password": BENCH_PASSWORD})
+        response.raise_for_status()
+        ctx.tokens[user] = response.json()["access_token"]
+
+    conn = sqlite3.connect(todo_db)
+    try:
+        for user in range(ctx.users):
+            rows = conn.execute(
+                "SELECT t.id FROM todo_items AS t JOIN users AS u ON u.id = t.owner_id "
+                "WHERE u.username = ? LIMIT 1000",
+                (username_for(user),)
+            ).fetchall()
+            ctx.item_ids[user] = [row[0] for row in rows]
+    finally:
+        conn.close()
+
+
+@asynccontextmanager
+async def inprocess_clients():
+    """Клиенты обоих приложений в этом же процессе, без сети."""
+    from todo_app.app.api import app as todo_app
+    from shorturl_app.app.api import app as shorturl_app
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=todo_app), base_url="http://todo") as todo, \
+            httpx.AsyncClient(transport=httpx.ASGITransport(app=shorturl_app), base_url="http://shorturl") as shorturl:
+        yield {"todo": todo, "shorturl": shorturl}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_uvicorn(service_dir: str, env: dict, port: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.api:app", "--app-dir", service_dir,
+         "--host", "127.0.0.1", "--port", str(port), "--no-access-log"],
+        # From the root, so that the shared common package is importable
+        cwd=REPO_ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.STDOUT,
+    )
+
+
+async def _wait_ready(client: httpx.AsyncClient, timeout: float = 30.0) -> None:
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            await client.get("/health")
+            return
+        except httpx.TransportError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+@asynccontextmanager
+async def uvicorn_clients(env: dict, concurrency: int):
+    """Оба приложения отдельными процессами uvicorn на локальных портах."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    ports = {"todo": _free_port(), "shorturl": _free_port()}
+    processes = [
+        _start_uvicorn("todo_app", env, ports["todo"]),
+        _start_uvicorn("shorturl_app", env, ports["shorturl"]),
+    ]
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{ports['todo']}", limits=limits) as todo, \
+                httpx.AsyncClient(base_url=f"http://127.0.0.1:{ports['shorturl']}", limits=limits) as shorturl:
+            await _wait_ready(todo)
+            await _wait_ready(shorturl)
+            yield {"todo": todo, "shorturl": shorturl}
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
@@ -0,0 +1,123 @@
+"""
+Нагрузочный прогон обоих сервисов: p50/p95/p99 и запросы в секунду по эндпоинтам.
+
+Запуск из корня репозитория:
+    python -m benchmarks.run --scale small
+    python -m benchmarks.run --scale large --mode uvicorn --concurrency 64 --duration 30
+    python -m benchmarks.run --scale small --save-baseline      # записать baseline
+    python -m benchmarks.run --scale small --compare            # код 1 при регрессии (для CI)
+
+Базы засеиваются один раз в --data-dir и переиспользуются между прогонами;
+сценарии shorten и item_update пишут в базы, поэтому каждый прогон работает
+с копией засеянных баз во временном каталоге, и результаты сравнимы с baseline.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+
+from benchmarks import baseline
+from benchmarks.settings import configure_apps, make_workdir
+
+SCALES = {
+    "small": {"links": 10_000, "users": 4, "items_per_user": 1_000},
+    "medium": {"links": 1_000_000, "users": 10, "items_per_user": 10_000},
+    "large": {"links": 10_000_000, "users": 10, "items_per_user": 100_000},
+}
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Load test both services")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--links", type=int, help="override the scale's number of links")
+    parser.add_argument("--users", type=int, help="override the scale's number of users")
+    parser.add_argument("--items-per-user", type=int, help="override the scale's items per user")
+    parser.add_argument("--mode", choices=("inprocess", "uvicorn"), default="inprocess")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per endpoint")
+    parser.add_argument("--endpoints", nargs="+", help="subset of endpoints to run")
+    parser.add_argument("--data-dir", default=os.path.join("benchmarks", "data"))
+    parser.add_argument("--baseline-name", help="defaults to <mode>-<scale>")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="exit 1 on regression against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative p95/rps change")
+    return parser.parse_args(argv)
+
+
+def print_report(results, out=sys.stdout):
+    print(f"{'endpoint':<14}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}", file=out)
+    for row in results:
+        print(
+            f"{row['endpoint']:<14}{row['requests']:>10}{row['errors']:>8}{row['rps']:>10.1f}"
+            f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}",
+            file=out
+        )
+
+
+async def run(args, scale, env, todo_db):
+    from benchmarks import load
+
+    names = args.endpoints or list(load.SCENARIOS)
+    ctx = load.Context(links=scale["links"], users=scale["users"])
+
+    if args.mode == "inprocess":
+        clients_cm = load.inprocess_clients()
+    else:
+        clients_cm = load.uvicorn_clients(env, args.concurrency)
+
+    results = []
+    async with clients_cm as clients:
+        if any(load.SCENARIOS[name].service == "todo" for name in names):
+            await load.prepare_todo_context(clients["todo"], ctx, todo_db)
+        for name in names:
+            scenario = load.SCENARIOS[name]
+            print(f"running {name} ({args.concurrency} clients, {args.duration:.0f}s)...", file=sys.stderr)
+            results.append(await load.run_scenario(
+                clients[scenario.service], scenario, ctx, args.concurrency, args.duration
+            ))
+    return results
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    scale = dict(SCALES[args.scale])
+    for key in ("links", "users", "items_per_user"):
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    suffix = f"{scale['links']}l-{scale['users']}u-{scale['items_per_user']}i"
+    seeded_todo_db = os.path.join(args.data_dir, f"todo-{suffix}.db")
+    seeded_shorturl_db = os.path.join(args.data_dir, f"shorturl-{suffix}.db")
+    workdir = make_workdir("bench_run_")
+    todo_db = os.path.join(workdir, "todo.db")
+    shorturl_db = os.path.join(workdir, "shorturl.db")
+    env = configure_apps(todo_db, shorturl_db)
+
+    from benchmarks import seed
+    log = lambda message: print(message, file=sys.stderr)
+    seed.seed_shorturl(seeded_shorturl_db, scale["links"], log=log)
+    seed.seed_todo(seeded_todo_db, scale["users"], scale["items_per_user"], log=log)
+    try:
+        seed.copy_database(seeded_shorturl_db, shorturl_db)
+        seed.copy_database(seeded_todo_db, todo_db)
+        results = asyncio.run(run(args, scale, env, todo_db))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print_report(results)
+
+    name = args.baseline_name or f"{args.mode}-{args.scale}"
+    params = {**scale, "mode": args.mode, "concurrency": args.concurrency, "duration": args.duration}
+    if args.save_baseline:
+        print(f"baseline saved to {baseline.save(name, results, params)}", file=sys.stderr)
+    if args.compare:
+        regressions = baseline.compare(baseline.load(name), results, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Наполнение баз данных для нагрузочных тестов в заданном масштабе.
+
+Запуск из корня репозитория:
+    python -m benchmarks.seed shorturl --db bench/shorturl.db --links 10000000
+    python -m benchmarks.seed todo --db bench/todo.db --users 10 --items-per-user 100000
+
+Данные детерминированы: short_id ссылки i — short_id_for(i), пользователи
+bench0..benchN с паролем BENCH_PASSWORD, поэтому генератор нагрузки знает их
+без чтения базы.
+"""
+import argparse
+import os
+import sqlite3
+import string
+import sys
+import time
+from datetime import datetime
+
+BENCH_PASSWORD = "bench-password"
+CHUNK_SIZE = 50_000
+
+_ALPHABET = string.ascii_letters + string.digits
+# Offset keeps generated ids at the production length of 6 characters
+_SHORT_ID_OFFSET = len(_ALPHABET) ** 5
+
+
+def short_id_for(index: int) -> str:
+    value = index + _SHORT_ID_OFFSET
+    chars = []
+    while value:
+        value, rem = divmod(value, len(_ALPHABET))
+        chars.append(_ALPHABET[rem])
+    return "".join(reversed(chars))
+
+
+def username_for(index: int) -> str:
+    return f"bench{index}"
+
+
+def _bulk_engine(path: str):
+    from sqlalchemy import create_engine, event
+
+    engine = create_engine(f"sqlite:///{os.path.abspath(path)}")
+
+    @event.listens_for(engine, "connect")
+    def _fast_pragmas(dbapi_connection, connection_record):
+        # Seeding only: durability does not matter, throughput does
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=OFF")
+        cursor.close()
+
+    return engine
+
+
+def _chunks(total: int):
+    for start in range(0, total, CHUNK_SIZE):
+        yield start, min(start + CHUNK_SIZE, total)
+
+
+def seed_shorturl(path: str, links: int, log=print) -> None:
+    from shorturl_app.app import models
+
+    engine = _bulk_engine(path)
+    models.Base.metadata.create_all(bind=engine)
+    table = models.URLMapping.__table__
+    now = datetime.utcnow()
+
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        existing = conn.execute(table.select().with_only_columns(table.c.id).limit(1)).first()
+        if existing:
+            log(f"{path}: already seeded, skipping")
+            return
+        for start, end in _chunks(links):
+            conn.execute(table.insert(), [
+                {
+                    "short_id": short_id_for(i),
+                    "original_url": f"https://example.com/bench/{i}",
+                    "created_at": now,
+                    "clicks": 0,
+                    "is_active": True,
+                }
+                for i in range(start, end)
+            ])
+            log(f"links {end}/{links}")
+    log(f"seeded {links} links in {time.perf_counter() - started:.1f}s")
+    engine.dispose()
+
+
+def seed_todo(path: str, users: int, items_per_user: int, log=print) -> None:
+    from todo_app.app import models
+    from todo_app.app.auth import get_password_hash
+
+    engine = _bulk_engine(path)
+    models.Base.metadata.create_all(bind=engine)
+    users_table = models.User.__table__
+    items_table = models.TodoItem.__table__
+    summaries_table = models.TodoSummary.__table__
+    # One Argon2 hash for everyone: hashing millions of passwords is not the point
+    hashed_password = get_password_hash(BENCH_PASSWORD)
+    now = datetime.utcnow()
+
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        existing = conn.execute(users_table.select().with_only_columns(users_table.c.id).limit(1)).first()
+        if existing:
+            log(f"{path}: already seeded, skipping")
+            return
+        for u in range(users):
+            user_id = conn.execute(users_table.insert().values(
+                username=username_for(u),
+                email=f"{username_for(u)}@example.com",
+                hashed_password=hashed_password,
+                is_active=True,
+                items_version=items_per_user,
+            )).inserted_primary_key[0]
+            completed = 0
+            for start, end in _chunks(items_per_user):
+                rows = [
+                    {
+                        "title": f"Задача {i} пользователя {u}",
+                        "description": f"Описание задачи {i} для нагрузочного теста",
+                        "completed": i % 3 == 0,
+                        "owner_id": user_id,
+                        "created_at": now,
+                        "updated_at": now,
+                        "version": i + 1,
+                    }
+                    for i in range(start, end)
+                ]
+                completed += sum(row["completed"] for row in rows)
+                conn.execute(items_table.insert(), rows)
+            conn.execute(summaries_table.insert().values(
+                owner_id=user_id, total=items_per_user, completed=completed
+            ))
+            log(f"user {u + 1}/{users}: {items_per_user} items")
+    log(f"seeded {users} users x {items_per_user} items in {time.perf_counter() - started:.1f}s")
+    engine.dispose()
+
+
+def copy_database(source: str, target: str) -> None:
+    """Согласованная копия засеянной базы (вместе с WAL) через backup API SQLite."""
+    src, dst = sqlite3.connect(source), sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed benchmark databases")
+    subparsers = parser.add_subparsers(dest="service", required=True)
+
+    shorturl = subparsers.add_parser("shorturl")
+    shorturl.add_argument("--db", required=True)
+    shorturl.add_argument("--links", type=int, default=10_000)
+
+    todo = subparsers.add_parser("todo")
+    todo.add_argument("--db", required=True)
+    todo.add_argument("--users", type=int, default=10)
+    todo.add_argument("--items-per-user", type=int, default=1_000)
+
+    args = parser.parse_args(argv)
+
+    from benchmarks.settings import configure_apps
+    if args.service == "shorturl":
+        configure_apps(os.devnull, args.db)
+        seed_shorturl(args.db, args.links)
+    else:
+        configure_apps(args.db, os.devnull)
+        seed_todo(args.db, args.users, args.items_per_user)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
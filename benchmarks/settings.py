@@ -0,0 +1,22 @@
+"""
+Окружение приложений для бенчмарков.
+
+Оба сервиса читают настройки при импорте, поэтому configure_apps()
+вызывается до первого импорта todo_app.app / shorturl_app.app.
+"""
+import os
+import tempfile
+
+
+def configure_apps(todo_db: str, shorturl_db: str) -> dict:
+    """Направить оба приложения на указанные файлы SQLite; вернуть окружение."""
+    os.environ["DATABASE_URL_TODO"] = f"sqlite:///{os.path.abspath(todo_db)}"
+    os.environ["DATABASE_URL_SHORT_URL"] = f"sqlite:///{os.path.abspath(shorturl_db)}"
+    os.environ.setdefault("SECRET_KEY", "bench")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+    return dict(os.environ)
+
+
+def make_workdir(prefix: str) -> str:
+    return tempfile.mkdtemp(prefix=prefix)
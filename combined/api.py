@@ -0,0 +1,51 @@
+"""
+Оба сервиса в одном ASGI-процессе: один интерпретатор, одни импорты
+FastAPI/SQLAlchemy, общий event loop.
+
+COMBINED_ROUTING=prefix (по умолчанию): todo под TODO_PREFIX (/todo),
+short_url под SHORTURL_PREFIX (корень, чтобы короткие ссылки остались короткими).
+COMBINED_ROUTING=host: выбор приложения по заголовку Host (TODO_HOST, SHORTURL_HOST).
+
+Запуск из корня репозитория:
+    uvicorn combined.api:app --host 0.0.0.0 --port 8000
+"""
+import os
+from contextlib import AsyncExitStack, asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.routing import Host, Mount
+
+from todo_app.app.api import app as todo_app
+from shorturl_app.app.api import app as shorturl_app
+
+ROUTING = os.getenv("COMBINED_ROUTING", "prefix")
+TODO_PREFIX = os.getenv("TODO_PREFIX", "/todo")
+SHORTURL_PREFIX = os.getenv("SHORTURL_PREFIX", "")
+TODO_HOST = os.getenv("TODO_HOST", "todo.localhost")
+SHORTURL_HOST = os.getenv("SHORTURL_HOST", "{host}")
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    # Mounted apps do not get lifespan events, so run both here
+    async with AsyncExitStack() as stack:
+        for service in (todo_app, shorturl_app):
+            await stack.enter_async_context(service.router.lifespan_context(service))
+        yield
+
+
+if ROUTING == "host":
+    routes = [
+        Host(TODO_HOST, app=todo_app),
+        Host(SHORTURL_HOST, app=shorturl_app),
+    ]
+elif ROUTING == "prefix":
+    # More specific prefix first: the short_url mount may be the catch-all root
+    routes = [
+        Mount(TODO_PREFIX, app=todo_app),
+        Mount(SHORTURL_PREFIX, app=shorturl_app),
+    ]
+else:
+    raise ValueError(f"COMBINED_ROUTING must be 'prefix' or 'host', got {ROUTING!r}")
+
+app = Starlette(routes=routes, lifespan=lifespan)
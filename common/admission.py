@@ -0,0 +1,109 @@
+"""
+Адаптивное ограничение числа одновременных запросов (admission control).
+
+Чтения (GET/HEAD) и записи ограничиваются раздельно, чтобы очередь записей
+за единственным писателем SQLite не тормозила чтения. Лимит каждого класса
+подстраивается по наблюдаемой латентности (AIMD): быстрый ответ
+увеличивает лимит примерно на 1 за окно из limit запросов, ответ дольше
+целевой латентности уменьшает его в BACKOFF раз, не чаще раза за это время.
+Запросы сверх лимита сразу получают 503 с Retry-After, не занимая пул потоков.
+"""
+import json
+from time import perf_counter
+
+BACKOFF = 0.9
+RETRY_AFTER_SECONDS = 1
+READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+_REJECT_BODY = json.dumps({"detail": "Service is overloaded, retry later"}).encode()
+_REJECT_HEADERS = [
+    (b"content-type", b"application/json"),
+    (b"content-length", str(len(_REJECT_BODY)).encode()),
+    (b"retry-after", str(RETRY_AFTER_SECONDS).encode()),
+]
+
+
+class AIMDLimit:
+    """Лимит параллельности одного класса запросов; меняется только в цикле событий."""
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, target_latency: float):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self._last_decrease = 0.0
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= int(self.limit):
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self, latency: float, now: float) -> None:
+        self.in_flight -= 1
+        if latency > self.target_latency:
+            # Requests admitted together finish slow together: back off once for them
+            if now - self._last_decrease >= self.target_latency:
+                self.limit = max(self.min_limit, self.limit * BACKOFF)
+                self._last_decrease = now
+        elif self.in_flight + 1 >= int(self.limit):
+            # Grow only while the limit is actually what bounds concurrency
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware: sheds requests above the adaptive read/write limits.
+
+    Enabled by settings.ADMISSION_CONTROL (read per request); target latencies
+    come from settings.ADMISSION_READ_TARGET_MS and ADMISSION_WRITE_TARGET_MS.
+    Paths in `exempt` (probes, metrics, long-lived streams) are never limited.
+    """
+
+    def __init__(self, app, settings, exempt=(), registry=None):
+        self.app = app
+        self.settings = settings
+        self.exempt = frozenset(exempt)
+        self.limits = {
+            "read": AIMDLimit(64, 4, 512, settings.ADMISSION_READ_TARGET_MS / 1000),
+            "write": AIMDLimit(8, 1, 40, settings.ADMISSION_WRITE_TARGET_MS / 1000),
+        }
+        self.rejected = None
+        if registry is not None:
+            self.rejected = registry.counter(
+                "admission_rejected_total", "Requests shed with 503 by admission control", ("class",)
+            )
+            registry.gauge_callback(
+                "admission_limit", "Current adaptive concurrency limit",
+                lambda: {(kind,): int(limit.limit) for kind, limit in self.limits.items()}, ("class",)
+            )
+            registry.gauge_callback(
+                "admission_in_flight", "Admitted requests in progress",
+                lambda: {(kind,): limit.in_flight for kind, limit in self.limits.items()}, ("class",)
+            )
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not self.settings.ADMISSION_CONTROL
+            or scope["path"].removeprefix(scope.get("root_path", "")) in self.exempt
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        kind = "read" if scope["method"] in READ_METHODS else "write"
+        limit = self.limits[kind]
+        if not limit.try_acquire():
+            if self.rejected is not None:
+                self.rejected.inc((kind,))
+            await send({"type": "http.response.start", "status": 503, "headers": _REJECT_HEADERS})
+            await send({"type": "http.response.body", "body": _REJECT_BODY})
+            return
+
+        started = perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            now = perf_counter()
+            limit.release(now - started, now)
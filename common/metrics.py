@@ -0,0 +1,278 @@
+"""
+Метрики сервиса в текстовом формате Prometheus, без внешних зависимостей.
+
+Значения шардированы по потокам: каждый поток пишет только в свой шард,
+поэтому запись не берет блокировок. /metrics складывает шарды при чтении.
+
+У каждого сервиса свой Registry: в совмещенном процессе (combined) метрики
+приложений не смешиваются.
+"""
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Shards:
+    """Словари значения меток -> состояние по потокам; пишет только поток-владелец."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def local(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:  # once per thread
+                self._shards.append(shard)
+            return shard
+
+    def items(self):
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            yield from list(shard.items())
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._shards = _Shards()
+
+    def inc(self, labels=(), amount: float = 1) -> None:
+        shard = self._shards.local()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def values(self) -> dict:
+        totals = {}
+        for labels, value in self._shards.items():
+            totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+    def render(self):
+        for labels, value in sorted(self.values().items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels=(), amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+
+class GaugeCallback:
+    """
+    Gauge whose value is read from `callback` at scrape time; with labelnames
+    the callback returns a dict of label values -> value.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+
+    def render(self):
+        if not self.labelnames:
+            yield f"{self.name} {self.callback()}"
+            return
+        for labels, value in sorted(self.callback().items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._shards = _Shards()
+
+    def observe(self, labels, value: float) -> None:
+        shard = self._shards.local()
+        state = shard.get(labels)
+        if state is None:
+            # per-bucket counts, +Inf, then sum
+            state = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def time(self, labels=()):
+        return _Timer(self, labels)
+
+    def values(self) -> dict:
+        totals = {}
+        for labels, state in self._shards.items():
+            total = totals.setdefault(labels, [0] * len(state))
+            for i, value in enumerate(list(state)):
+                total[i] += value
+        return totals
+
+    def render(self):
+        for labels, state in sorted(self.values().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), state):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {state[-1]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(self.labels, perf_counter() - self.started)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def _get_or_register(self, metric_class, name, *args):
+        # A metric registered again (e.g. by a rebuilt middleware stack) keeps its values
+        metric = self._metrics.get(name)
+        if type(metric) is metric_class:
+            return metric
+        return self.register(metric_class(name, *args))
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._get_or_register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._get_or_register(Gauge, name, documentation, labelnames)
+
+    def gauge_callback(self, name, documentation, callback, labelnames=()) -> GaugeCallback:
+        return self.register(GaugeCallback(name, documentation, callback, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_register(Histogram, name, documentation, labelnames, buckets)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware: число запросов в работе и гистограмма латентности по шаблону маршрута."""
+
+    def __init__(self, app, registry: Registry):
+        self.app = app
+        self.in_flight = registry.gauge(
+            "http_requests_in_flight", "HTTP requests currently being served"
+        )
+        self.duration = registry.histogram(
+            "http_request_duration_seconds", "HTTP request latency by route template",
+            ("method", "route", "status")
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        self.in_flight.inc()
+        started = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.in_flight.dec()
+            # Route template, not the raw path, keeps label cardinality bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.duration.observe((scope["method"], route, status), perf_counter() - started)
+
+
+def instrument_engine(engine, registry: Registry) -> None:
+    """Время SQL-выражений и ожидание соединения из пула `engine` — в `registry`."""
+    statement_duration = registry.histogram(
+        "db_statement_duration_seconds", "SQL statement execution time by statement type",
+        ("statement",)
+    )
+    checkout_wait = registry.histogram(
+        "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection"
+    )
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_started"].pop()
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        statement_duration.observe((verb,), perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        if context.connection is not None and context.connection.info.get("metrics_started"):
+            context.connection.info["metrics_started"].pop()
+
+    pool = engine.pool
+    pool_connect = pool.connect
+
+    def timed_connect():
+        started = perf_counter()
+        try:
+            return pool_connect()
+        finally:
+            checkout_wait.observe((), perf_counter() - started)
+
+    # Pool events fire only after checkout, so the wait is timed around connect()
+    pool.connect = timed_connect
+    registry.gauge_callback(
+        "db_pool_checked_out", "Connections currently checked out of the pool",
+        lambda: pool.checkedout() if hasattr(pool, "checkedout") else 0
+    )
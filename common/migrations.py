@@ -0,0 +1,87 @@
+"""
+Инициализация схемы БД при старте, только когда она действительно нужна.
+
+В таблице schema_meta хранится версия схемы, с которой база была
+инициализирована. Если она совпадает с версией кода, старт стоит один
+SELECT; иначе выполняются create_all и добавочные миграции (недостающие
+столбцы и индексы существующих таблиц), затем необязательный шаг
+приложения upgrade(conn, from_version) для того, что не сводится к
+добавлению столбцов (перестройка таблиц, заполнение данных), после чего
+версия записывается. Версию поднимают при каждом изменении моделей.
+
+Миграция идет одной транзакцией BEGIN IMMEDIATE: pysqlite сам не открывает
+транзакцию перед DDL, и без нее каждый ALTER/CREATE фиксировался бы отдельно.
+Версия перечитывается уже под блокировкой записи, поэтому из нескольких
+одновременно стартующих воркеров миграцию выполняет только первый.
+"""
+from typing import Callable, Optional
+
+from sqlalchemy import MetaData, inspect
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateColumn
+
+SCHEMA_META_DDL = (
+    "CREATE TABLE IF NOT EXISTS schema_meta ("
+    "id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)"
+)
+
+
+def current_version(conn: Connection):
+    conn.exec_driver_sql(SCHEMA_META_DDL)
+    return conn.exec_driver_sql("SELECT version FROM schema_meta WHERE id = 1").scalar()
+
+
+def _column_ddl(conn: Connection, column) -> str:
+    ddl = str(CreateColumn(column).compile(dialect=conn.dialect))
+    default = column.default
+    if column.server_default is None and default is not None and default.is_scalar:
+        # ADD COLUMN ... NOT NULL требует значения по умолчанию для уже существующих строк
+        ddl += f" DEFAULT {column.type.literal_processor(conn.dialect)(default.arg)}"
+    return ddl
+
+
+def add_missing_columns(conn: Connection, metadata: MetaData) -> list:
+    """ALTER TABLE ... ADD COLUMN для столбцов моделей, которых нет в существующих таблицах."""
+    inspector = inspect(conn)
+    added = []
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {_column_ddl(conn, column)}")
+                added.append(f"{table.name}.{column.name}")
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+    return added
+
+
+def ensure_schema(
+    engine: Engine, metadata: MetaData, version: int,
+    upgrade: Optional[Callable[[Connection, Optional[int]], None]] = None
+) -> bool:
+    """Довести базу до версии version; True, если что-то пришлось выполнить."""
+    # AUTOCOMMIT: pysqlite не вмешивается, транзакцией управляют BEGIN/COMMIT ниже
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if current_version(conn) == version:
+            return False
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            stored = current_version(conn)
+            if stored != version:
+                # Сначала столбцы: на них могут опираться DDL-хуки create_all
+                add_missing_columns(conn, metadata)
+                metadata.create_all(bind=conn)
+                if upgrade is not None:
+                    upgrade(conn, stored)
+                conn.exec_driver_sql(
+                    "INSERT INTO schema_meta (id, version) VALUES (1, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET version = excluded.version",
+                    (version,)
+                )
+        except BaseException:
+            conn.exec_driver_sql("ROLLBACK")
+            raise
+        conn.exec_driver_sql("COMMIT")
+    return stored != version
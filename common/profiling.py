@@ -0,0 +1,276 @@
+"""
+Профилирование отдельных запросов по требованию.
+
+Запрос профилируется, если в нем есть подписанный заголовок X-Profile
+(см. sign) или он попал в выборку с долей sample_rate. Для такого запроса:
+- фоновый поток раз в SAMPLE_INTERVAL смотрит цепочку await задачи запроса
+  и относит отсчет к фазе: зависимости, эндпоинт, сериализация, прочее;
+- SQL-выражения с длительностями пишутся из событий движка SQLAlchemy;
+- отдельные участки (Argon2) засекаются через timed().
+
+Готовые профили лежат в кольцевом буфере PROFILES. Непрофилируемый запрос
+платит одной проверкой в middleware и чтением ContextVar в хуках.
+
+Подпись заголовка (секрет — переменная окружения PROFILE_SECRET):
+    python -m common.profiling --ttl 600
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from time import perf_counter
+from typing import Optional
+
+from sqlalchemy import event
+
+HEADER = "x-profile"
+_HEADER_KEY = HEADER.encode()
+SAMPLE_INTERVAL = 0.002
+MAX_STATEMENTS = 100
+PROFILES = deque(maxlen=200)
+
+# Побеждает самое глубокое совпадение в цепочке await задачи
+PHASES = {
+    "solve_dependencies": "dependencies",
+    "run_endpoint_function": "endpoint",
+    "serialize_response": "serialization",
+}
+
+_current: ContextVar[Optional["Profile"]] = ContextVar("profile", default=None)
+
+
+def sign(secret: str, expires: int) -> str:
+    """Значение заголовка X-Profile, действительное до unix-времени expires."""
+    mac = hmac.new(secret.encode(), str(expires).encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{mac}"
+
+
+def verify(token: Optional[str], secret: Optional[str]) -> bool:
+    if not secret or not token:
+        return False
+    expires, _, _ = token.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(sign(secret, int(expires)), token)
+
+
+class Profile:
+    def __init__(self, method: str, path: str, reason: str):
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.started_at = datetime.utcnow()
+        self.samples = {}
+        self.statements = []
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.timings = {}
+
+    def add_statement(self, statement: str, seconds: float) -> None:
+        self.sql_count += 1
+        self.sql_seconds += seconds
+        if len(self.statements) < MAX_STATEMENTS:
+            self.statements.append({"statement": statement.strip(), "duration_ms": seconds * 1000})
+
+    def add_timing(self, label: str, seconds: float) -> None:
+        self.timings[label] = self.timings.get(label, 0.0) + seconds
+
+    def report(self, route: str, status: str, seconds: float) -> dict:
+        total_samples = sum(self.samples.values())
+        return {
+            "method": self.method,
+            "path": self.path,
+            "route": route,
+            "status": status,
+            "reason": self.reason,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": seconds * 1000,
+            "samples": total_samples,
+            # Время запроса делится пропорционально отсчетам каждой фазы
+            "phases_ms": {
+                phase: seconds * 1000 * count / total_samples
+                for phase, count in sorted(self.samples.items())
+            },
+            "sql": {
+                "count": self.sql_count,
+                "total_ms": self.sql_seconds * 1000,
+                "statements": self.statements,
+            },
+            "timings_ms": {label: value * 1000 for label, value in sorted(self.timings.items())},
+        }
+
+
+def _phase(task: asyncio.Task) -> str:
+    """Фаза запроса по корутинам, которые ожидает его задача."""
+    phase = "other"
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "ag_frame", None)
+        if frame is None:
+            break
+        phase = PHASES.get(frame.f_code.co_name, phase)
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "ag_await", None)
+    return phase
+
+
+class _Sampler:
+    """Один фоновый поток, живущий, только пока профилируется хотя бы один запрос."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, profile: Profile, task: asyncio.Task) -> None:
+        with self._lock:
+            self._active[profile] = task
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+
+    def remove(self, profile: Profile) -> None:
+        with self._lock:
+            self._active.pop(profile, None)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                for profile, task in self._active.items():
+                    try:
+                        phase = _phase(task)
+                    except Exception:  # цепочка изменилась во время обхода: отсчет пропускаем
+                        continue
+                    profile.samples[phase] = profile.samples.get(phase, 0) + 1
+
+
+_sampler = _Sampler(SAMPLE_INTERVAL)
+
+
+class timed:
+    """Засекает участок кода в профиль текущего запроса, если он профилируется."""
+    __slots__ = ("label", "profile", "started")
+
+    def __init__(self, label: str):
+        self.label = label
+
+    def __enter__(self):
+        self.profile = _current.get()
+        if self.profile is not None:
+            self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profile is not None:
+            self.profile.add_timing(self.label, perf_counter() - self.started)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware: профилирует подписанные и попавшие в выборку запросы в PROFILES.
+
+    PROFILE_SECRET и PROFILE_SAMPLE_RATE читаются из settings на каждый запрос.
+    Пути из exclude (служебные и потоковые: SSE, экспорт, импорт) не профилируются
+    никогда — профиль многочасового потока бессмыслен, а сэмплер просыпался бы
+    каждые SAMPLE_INTERVAL все это время.
+    """
+
+    def __init__(self, app, settings, exclude=()):
+        self.app = app
+        self.settings = settings
+        self.exclude = frozenset(exclude)
+
+    def _reason(self, scope) -> Optional[str]:
+        secret = self.settings.PROFILE_SECRET
+        if secret:
+            for name, value in scope["headers"]:
+                if name == _HEADER_KEY:
+                    if verify(value.decode("latin-1"), secret):
+                        return "header"
+                    break
+        sample_rate = self.settings.PROFILE_SAMPLE_RATE
+        if sample_rate and random.random() < sample_rate:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].removeprefix(scope.get("root_path", "")) in self.exclude:
+            await self.app(scope, receive, send)
+            return
+        reason = self._reason(scope)
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        profile = Profile(scope["method"], scope["path"], reason)
+        token = _current.set(profile)
+        _sampler.add(profile, asyncio.current_task())
+        started = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = perf_counter() - started
+            _sampler.remove(profile)
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            PROFILES.append(profile.report(route, status, elapsed))
+
+
+def instrument_engine(engine) -> None:
+    """SQL-выражения с длительностями в профиль текущего запроса."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("profile_started", []).append(perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = _current.get()
+        if profile is not None and conn.info.get("profile_started"):
+            profile.add_statement(statement, perf_counter() - conn.info["profile_started"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        if context.connection is not None and context.connection.info.get("profile_started"):
+            context.connection.info["profile_started"].pop()
+
+
+def main(argv=None) -> int:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Print a signed X-Profile header value")
+    parser.add_argument("--ttl", type=int, default=600, help="seconds the value stays valid")
+    args = parser.parse_args(argv)
+
+    secret = os.getenv("PROFILE_SECRET")
+    if not secret:
+        print("PROFILE_SECRET is not set", file=sys.stderr)
+        return 1
+    print(sign(secret, int(time.time()) + args.ttl))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
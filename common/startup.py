@@ -0,0 +1,100 @@
+"""
+Отчет о холодном старте.
+
+REPORT — секунды от запуска процесса до этапов: imported (модуль api
+загружен), ready (lifespan завершил подготовку), first_request (отдан
+первый ответ). Отдается в /health и пишется в лог после первого запроса.
+
+Время импорта по модулям (python -X importtime):
+    python -m common.startup --module todo_app.app.api --top 20
+"""
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _process_started() -> float:
+    """Unix-время старта процесса (Linux /proc); на других системах — время импорта этого модуля."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the parenthesised command name; starttime is field 22
+            starttime = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return boot_time + starttime / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return time.time()
+
+
+PROCESS_STARTED = _process_started()
+REPORT = {}
+
+
+def mark(stage: str) -> None:
+    """Запомнить первое достижение `stage`, в секундах от старта процесса."""
+    REPORT.setdefault(stage, round(time.time() - PROCESS_STARTED, 3))
+
+
+class FirstRequestMiddleware:
+    """ASGI middleware: отмечает first_request и один раз пишет REPORT в лог."""
+
+    def __init__(self, app):
+        self.app = app
+        self.seen = False
+
+    async def __call__(self, scope, receive, send):
+        if self.seen or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        self.seen = True
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            mark("first_request")
+            logger.info("startup: %s", ", ".join(f"{stage}={seconds}s" for stage, seconds in REPORT.items()))
+
+
+def import_times(module: str) -> list:
+    """(cumulative_us, self_us, depth, name) for every module imported by `import module`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # header line
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(cumulative_us), int(self_us), depth, name.strip()))
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Import time per module of the app")
+    parser.add_argument("--module", required=True, help="e.g. todo_app.app.api")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    rows = import_times(args.module)
+    total = next(row[0] for row in rows if row[3] == args.module)
+    print(f"import {args.module}: {total / 1000:.1f} ms")
+    print(f"\nslowest modules, self time (top {args.top}):")
+    for cumulative, self_us, _, name in sorted(rows, key=lambda row: row[1], reverse=True)[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {cumulative / 1000:8.1f} ms cumulative  {name}")
+    print(f"\nheaviest top-level imports, cumulative (top {args.top}):")
+    top_level = [row for row in rows if row[2] <= 1 and not row[3].startswith("_")]
+    for cumulative, _, _, name in sorted(top_level, reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,28 +1,72 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
-from fastapi.responses import RedirectResponse
+import asyncio
+from typing import Optional
+
+from fastapi import FastAPI, Depends, Header, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, RedirectResponse
 from sqlalchemy.orm import Session
-import uvicorn
 
-from contextlib import  asynccontextmanager
+from contextlib import  asynccontextmanager, suppress
+
+from common import admission, metrics, profiling, startup
+from common.responses import FastJSONResponse
 
-from . import crud, models
+from . import clicks, crud
 from . import schemas
-from .database import get_db, engine
+from .database import REGISTRY, get_db, init_db
+from .config import ENV
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    models.Base.metadata.create_all(bind=engine)
+    init_db()
+    startup.mark("ready")
+    flusher = asyncio.create_task(clicks.run_periodically(ENV.CLICK_FLUSH_SECONDS))
     yield
+    flusher.cancel()
+    with suppress(asyncio.CancelledError):
+        await flusher
+    await run_in_threadpool(clicks.flush_with_new_session)
 
 app = FastAPI(
     title="URL Shortener Service",
     description="Сервис для сокращения длинных URL",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse if ENV.FAST_JSON else JSONResponse
+)
+app.add_middleware(metrics.MetricsMiddleware, registry=REGISTRY)
+app.add_middleware(profiling.ProfilingMiddleware, settings=ENV, exclude=("/admin/profiles",))
+app.add_middleware(startup.FirstRequestMiddleware)
+# Outermost, so that shed requests cost as little as possible
+app.add_middleware(
+    admission.AdmissionMiddleware,
+    settings=ENV,
+    exempt=("/health", "/metrics", "/admin/profiles"),
+    registry=REGISTRY
 )
 
 
+@app.get("/health", include_in_schema=False)
+async def health():
+    """Проба готовности без обращения к БД (объявлена до /{short_id})"""
+    return {"status": "ok", "startup": startup.REPORT}
+
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    """Метрики в формате Prometheus (объявлен до /{short_id})"""
+    return Response(REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/admin/profiles", include_in_schema=False)
+def read_profiles(x_profile: Optional[str] = Header(None)):
+    """Последние профили запросов, новые первыми; нужен подписанный заголовок X-Profile"""
+    if not profiling.verify(x_profile, ENV.PROFILE_SECRET):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return list(reversed(profiling.PROFILES))
+
+
 @app.post("/shorten", response_model=schemas.URLInfo)
 def create_short_url(
         url_data: schemas.URLCreate,
@@ -64,14 +108,12 @@ def redirect_to_original(
 
     - **short_id**: короткий идентификатор ссылки
     """
-    url_mapping = crud.get_url_by_short_id(db, short_id)
+    original_url = crud.resolve_short_id(db, short_id)
 
-    if not url_mapping:
+    if not original_url:
         raise HTTPException(status_code=404, detail="Ссылка не найдена или деактивирована")
 
-    crud.increment_clicks(db, url_mapping)
-
-    return RedirectResponse(url=url_mapping.original_url)
+    return RedirectResponse(url=original_url)
 
 
 @app.get("/stats/{short_id}", response_model=schemas.URLStats)
@@ -84,6 +126,14 @@ def get_url_statistics(
 
     - **short_id**: короткий идентификатор ссылки
     """
+    # Clicks buffered by this process are written first, so the count is current
+    clicks.buffer.flush(db)
+    if ENV.FAST_JSON:
+        row = crud.get_url_stats_row(db, short_id)
+        if not row:
+            raise HTTPException(status_code=404, detail="Ссылка не найдена")
+        return FastJSONResponse(row._asdict())
+
     url_mapping = crud.get_url_stats(db, short_id)
 
     if not url_mapping:
@@ -122,3 +172,4 @@ def root():
     }
 
 
+startup.mark("imported")
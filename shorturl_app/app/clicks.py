@@ -0,0 +1,84 @@
+"""
+Учет переходов по коротким ссылкам вне пути перенаправления.
+
+Переход только читает исходный URL (SELECT) и увеличивает счетчик в памяти
+процесса; накопленные клики записываются в url_mappings одной транзакцией
+раз в ENV.CLICK_FLUSH_SECONDS (фоновая задача lifespan), при остановке
+приложения и перед чтением /stats. Поэтому перенаправления не конкурируют
+с записями за единственного писателя SQLite.
+
+Цена: при падении процесса теряются клики последнего интервала, а /stats
+видит клики других воркеров с задержкой до одного интервала.
+"""
+import asyncio
+import logging
+import threading
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import URLMapping
+
+logger = logging.getLogger(__name__)
+
+_url_mappings = URLMapping.__table__
+_ADD_CLICKS = (
+    update(_url_mappings)
+    .where(_url_mappings.c.short_id == bindparam("b_short_id"))
+    .values(clicks=_url_mappings.c.clicks + bindparam("b_clicks"))
+)
+
+
+class ClickBuffer:
+    """Клики по short_id, еще не записанные в БД; record вызывается из пула потоков."""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def record(self, short_id: str) -> None:
+        with self._lock:
+            self._pending[short_id] = self._pending.get(short_id, 0) + 1
+
+    def flush(self, db: Session) -> int:
+        """Записать накопленные клики одним executemany; вернуть число ссылок."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            db.execute(_ADD_CLICKS, [
+                {"b_short_id": short_id, "b_clicks": count} for short_id, count in pending.items()
+            ])
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Keep the clicks for the next flush
+            with self._lock:
+                for short_id, count in pending.items():
+                    self._pending[short_id] = self._pending.get(short_id, 0) + count
+            raise
+        return len(pending)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
+buffer = ClickBuffer()
+
+
+def flush_with_new_session() -> int:
+    with SessionLocal() as db:
+        return buffer.flush(db)
+
+
+async def run_periodically(interval: float) -> None:
+    """Фоновая задача lifespan: запись накопленных кликов раз в interval секунд."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(flush_with_new_session)
+        except Exception:
+            logger.exception("click flush failed; retrying in %s s", interval)
@@ -5,3 +5,10 @@ load_dotenv()
 
 class ENV:
     DATABASE_URL = os.getenv("DATABASE_URL_SHORT_URL")
+    FAST_JSON = os.getenv("FAST_JSON", "false").lower() in ("1", "true", "yes")
+    PROFILE_SECRET = os.getenv("PROFILE_SECRET")
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "false").lower() in ("1", "true", "yes")
+    ADMISSION_READ_TARGET_MS = float(os.getenv("ADMISSION_READ_TARGET_MS", "50"))
+    ADMISSION_WRITE_TARGET_MS = float(os.getenv("ADMISSION_WRITE_TARGET_MS", "250"))
+    CLICK_FLUSH_SECONDS = float(os.getenv("CLICK_FLUSH_SECONDS", "1"))
@@ -1,5 +1,15 @@
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from . import clicks
 from .models import URLMapping
+from .schemas import URLStats
+
+# Сколько раз повторять вставку при совпадении сгенерированного short_id
+MAX_SHORT_ID_ATTEMPTS = 5
+
+URL_MAPPING_COLUMNS = tuple(URLMapping.__table__.c)
+URL_STATS_FIELDS = tuple(getattr(URLMapping, name) for name in URLStats.model_fields)
 
 
 def create_short_url(db: Session, url: str) -> URLMapping:
@@ -12,30 +22,33 @@ def create_short_url(db: Session, url: str) -> URLMapping:
     if existing_url:
         return existing_url
 
-    db_url = URLMapping(original_url=url)
-
-    while db.query(URLMapping).filter(URLMapping.short_id == db_url.short_id).first():
-        db_url.short_id = URLMapping.generate_short_id()
-
-    db.add(db_url)
-    db.commit()
-    db.refresh(db_url)
-    return db_url
-
-
-def get_url_by_short_id(db: Session, short_id: str) -> URLMapping:
-    """Получение URL по короткому идентификатору"""
-    return db.query(URLMapping).filter(
-        URLMapping.short_id == short_id,
-        URLMapping.is_active == True
-    ).first()
+    # Уникальность short_id проверяет индекс: INSERT ... RETURNING
+    # и повтор с новым id при конфликте вместо SELECT перед каждой вставкой
+    for attempt in range(MAX_SHORT_ID_ATTEMPTS):
+        try:
+            db_url = db.execute(
+                insert(URLMapping)
+                .values(original_url=url, short_id=URLMapping.generate_short_id())
+                .returning(*URL_MAPPING_COLUMNS)
+            ).one()
+        except IntegrityError:
+            db.rollback()
+            if attempt == MAX_SHORT_ID_ATTEMPTS - 1:
+                raise
+            continue
+        db.commit()
+        return db_url
 
 
-def increment_clicks(db: Session, url_mapping: URLMapping) -> None:
-    """Увеличение счетчика кликов"""
-    url_mapping.clicks += 1
-    db.commit()
-    db.refresh(url_mapping)
+def resolve_short_id(db: Session, short_id: str):
+    """Исходный URL одним SELECT, переход учитывается в буфере clicks; None, если ссылки нет"""
+    original_url = db.execute(
+        select(URLMapping.original_url)
+        .where(URLMapping.short_id == short_id, URLMapping.is_active == True)
+    ).scalar()
+    if original_url is not None:
+        clicks.buffer.record(short_id)
+    return original_url
 
 
 def get_url_stats(db: Session, short_id: str) -> URLMapping:
@@ -43,11 +56,19 @@ def get_url_stats(db: Session, short_id: str) -> URLMapping:
     return db.query(URLMapping).filter(URLMapping.short_id == short_id).first()
 
 
+def get_url_stats_row(db: Session, short_id: str):
+    """Статистика по короткой ссылке строкой только с полями URLStats"""
+    return db.execute(
+        select(*URL_STATS_FIELDS).where(URLMapping.short_id == short_id)
+    ).first()
+
+
 def delete_url(db: Session, short_id: str) -> bool:
     """Полное удаление ссылки из базы данных"""
-    url_mapping = db.query(URLMapping).filter(URLMapping.short_id == short_id).first()
-    if url_mapping:
-        db.delete(url_mapping)
-        db.commit()
-        return True
-    return False
\ No newline at end of file
+    deleted_id = db.execute(
+        delete(URLMapping)
+        .where(URLMapping.short_id == short_id)
+        .returning(URLMapping.id)
+    ).scalar()
+    db.commit()
+    return deleted_id is not None
@@ -3,18 +3,23 @@ from sqlalchemy.orm import sessionmaker
 
 import os
 
-from .models import Base
+from common import metrics, migrations, profiling
+
+from .models import Base, SCHEMA_VERSION
 from .config import ENV
 
 engine = create_engine(
     ENV.DATABASE_URL,
     connect_args={"check_same_thread": False}
 )
+REGISTRY = metrics.Registry()
+metrics.instrument_engine(engine, REGISTRY)
+profiling.instrument_engine(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    migrations.ensure_schema(engine, Base.metadata, SCHEMA_VERSION)
 
 def get_db():
     db = SessionLocal()
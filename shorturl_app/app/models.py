@@ -7,6 +7,9 @@ import string
 
 Base = declarative_base()
 
+# Bump on every model change: app startup migrates only when it differs
+SCHEMA_VERSION = 1
+
 
 class URLMapping(Base):
     __tablename__ = "url_mappings"
@@ -0,0 +1,33 @@
+from fastapi.testclient import TestClient
+
+from combined.api import app
+
+client = TestClient(app)
+
+
+def test_prefix_routing():
+    """Тест маршрутизации по префиксу в совмещенном приложении"""
+    response = client.get("/")
+    assert response.status_code == 200
+    assert response.json()["message"] == "URL Shortener Service"
+
+    response = client.get("/todo/items/")
+    assert response.status_code in [401, 403]
+
+    response = client.get("/todo/metrics")
+    assert response.status_code == 200
+    assert 'route="/items/"' in response.text
+
+
+def test_combined_documentation_endpoints():
+    """Тест документации обоих приложений под своими путями"""
+    assert client.get("/todo/docs").status_code == 200
+    assert client.get("/todo/openapi.json").json()["info"]["title"] == "Todo API"
+    assert client.get("/openapi.json").json()["info"]["title"] == "URL Shortener Service"
+
+
+def test_metrics_registries_are_separate():
+    """Тест: у каждого приложения в совмещенном процессе свой реестр метрик"""
+    client.get("/todo/items/")
+    assert 'route="/items/"' in client.get("/todo/metrics").text
+    assert 'route="/items/"' not in client.get("/metrics").text
@@ -1,14 +1,19 @@
 # test_api.py
+import time
+
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 
 
 from shorturl_app.app.database import Base, get_db
 from shorturl_app.app.api import app
+from shorturl_app.app.config import ENV
+from common import admission, profiling
 
 engine = create_engine("sqlite:///shorturl_app/data/test_shorturl.db")
+profiling.instrument_engine(engine)
 TestingSessionLocal = sessionmaker(bind=engine)
 
 
@@ -215,4 +220,124 @@ def test_api_documentation_endpoints():
     assert response.status_code == 200
 
     response = client.get("/redoc")
-    assert response.status_code == 200
\ No newline at end of file
+    assert response.status_code == 200
+
+def test_redirect_is_single_statement(setup_db):
+    """Тест: переход по ссылке выполняется одним SELECT, без записи в БД"""
+    short_id = client.post("/shorten", json={"url": "https://single.example.com"}).json()["short_id"]
+
+    statements = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record_statement)
+    try:
+        response = client.get(f"/{short_id}", follow_redirects=False)
+    finally:
+        event.remove(engine, "before_cursor_execute", record_statement)
+
+    assert response.status_code in [302, 307, 308]
+    assert len(statements) == 1
+    assert statements[0].startswith("SELECT url_mappings.original_url")
+
+
+def test_redirect_not_blocked_by_writer(setup_db):
+    """Тест: переход не ждет писателя SQLite, клики записываются позже"""
+    short_id = client.post("/shorten", json={"url": "https://busy.example.com"}).json()["short_id"]
+
+    writer = engine.raw_connection()
+    try:
+        # Another writer holds SQLite's write lock for the whole burst of redirects
+        writer.cursor().execute("BEGIN IMMEDIATE")
+        started = time.perf_counter()
+        for _ in range(20):
+            assert client.get(f"/{short_id}", follow_redirects=False).status_code == 307
+        elapsed = time.perf_counter() - started
+        writer.rollback()
+    finally:
+        writer.close()
+
+    # With the lock held, even one UPDATE per redirect would have waited out the busy timeout
+    assert elapsed < 2
+    assert client.get(f"/stats/{short_id}").json()["clicks"] == 20
+
+
+def test_fast_json_stats_match_schema(setup_db, monkeypatch):
+    """Тест: быстрый путь /stats отдает тот же JSON, что и обычный"""
+    short_id = client.post("/shorten", json={"url": "https://fast.example.com"}).json()["short_id"]
+    client.get(f"/{short_id}", follow_redirects=False)
+
+    slow = client.get(f"/stats/{short_id}")
+
+    monkeypatch.setattr(ENV, "FAST_JSON", True)
+    fast = client.get(f"/stats/{short_id}")
+    assert fast.status_code == 200
+    assert fast.json() == slow.json()
+    assert client.get("/stats/nonexistent").status_code == 404
+
+
+def test_metrics_endpoint(setup_db):
+    """Тест метрик в формате Prometheus"""
+    short_id = client.post("/shorten", json={"url": "https://metrics.example.com"}).json()["short_id"]
+    client.get(f"/{short_id}", follow_redirects=False)
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    text = response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/{short_id}",status="307"}' in text
+    assert 'http_request_duration_seconds_bucket{method="POST",route="/shorten",status="200",le="+Inf"}' in text
+    assert "# TYPE db_statement_duration_seconds histogram" in text
+
+
+def test_sampled_request_profile(setup_db, monkeypatch):
+    """Тест профилирования по выборке и доступа к /admin/profiles"""
+    short_id = client.post("/shorten", json={"url": "https://profile.example.com"}).json()["short_id"]
+    monkeypatch.setattr(ENV, "PROFILE_SECRET", "profile-secret")
+    monkeypatch.setattr(ENV, "PROFILE_SAMPLE_RATE", 1.0)
+    profiling.PROFILES.clear()
+
+    client.get(f"/{short_id}", follow_redirects=False)
+    monkeypatch.setattr(ENV, "PROFILE_SAMPLE_RATE", 0.0)
+
+    assert client.get("/admin/profiles").status_code == 404
+    token = profiling.sign("profile-secret", int(time.time()) + 60)
+    profiles = client.get("/admin/profiles", headers={"X-Profile": token}).json()
+    assert len(profiles) == 1
+    profile = profiles[0]
+    assert profile["route"] == "/{short_id}"
+    assert profile["reason"] == "sampled"
+    assert profile["status"] == "307"
+    assert profile["sql"]["count"] == 1
+    assert profile["sql"]["statements"][0]["statement"].startswith("SELECT url_mappings.original_url")
+
+
+def test_health_endpoint():
+    """Тест пробы готовности: не перехватывается маршрутом /{short_id}"""
+    response = client.get("/health")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ok"
+
+
+def _admission_middleware():
+    middleware = app.middleware_stack
+    while not isinstance(middleware, admission.AdmissionMiddleware):
+        middleware = middleware.app
+    return middleware
+
+
+def test_admission_sheds_writes_but_not_redirects(setup_db, monkeypatch):
+    """Тест: при исчерпанном лимите записей /shorten отвечает 503, переходы работают"""
+    short_id = client.post("/shorten", json={"url": "https://admission.example.com"}).json()["short_id"]
+    monkeypatch.setattr(ENV, "ADMISSION_CONTROL", True)
+    write_limit = _admission_middleware().limits["write"]
+    # Every write slot is taken by requests still in progress
+    monkeypatch.setattr(write_limit, "in_flight", int(write_limit.limit))
+
+    response = client.post("/shorten", json={"url": "https://shed.example.com"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+    assert client.get(f"/{short_id}", follow_redirects=False).status_code == 307
+    assert client.get("/health").status_code == 200
+    assert 'admission_rejected_total{class="write"} 1' in client.get("/metrics").text
@@ -1,12 +1,26 @@
+import asyncio
+import gzip
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import httpx
 import pytest
+from fastapi.security import HTTPAuthorizationCredentials
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, update
 from sqlalchemy.orm import sessionmaker
 
 from todo_app.app.database import Base, get_db
-from todo_app.app.api import app
+from todo_app.app.api import app, sse_body, stream_items
+from common import admission, migrations, profiling
+from todo_app.app import auth, crud, events, models, schemas, users
+from todo_app.app.config import ENV
 
 engine = create_engine("sqlite:///todo_app/data/test_todo.db")
+profiling.instrument_engine(engine)
 TestingSessionLocal = sessionmaker(bind=engine)
 
 
@@ -142,3 +156,841 @@ def test_update_and_delete_item(setup_db):
     assert get_resp.status_code == 404
 
 
+
+
+def test_search_items(setup_db):
+    """Тест полнотекстового поиска по задачам."""
+    client.post("/register", json={
+        "username": "user4",
+        "email": "user4@example.com",
+        "password": "pass123"
+    })
+    client.post("/register", json={
+        "username": "user5",
+        "email": "user5@example.com",
+        "password": "pass123"
+    })
+
+    login = client.post("/auth", json={"username": "user4", "password": "pass123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    other_login = client.post("/auth", json={"username": "user5", "password": "pass123"})
+    other_headers = {"Authorization": f"Bearer {other_login.json()['access_token']}"}
+
+    client.post("/items/", headers=headers, json={
+        "title": "Купить молоко",
+        "description": "И хлеб"
+    })
+    create_resp = client.post("/items/", headers=headers, json={
+        "title": "Позвонить маме",
+        "description": "Про молоко не забыть"
+    })
+    client.post("/items/", headers=other_headers, json={"title": "Чужое молоко"})
+
+    response = client.get("/items/search", headers=headers, params={"q": "молоко"})
+    assert response.status_code == 200
+    results = response.json()
+    assert len(results) == 2
+    assert results[0]["title"] == "Купить молоко"
+    assert "<b>молоко</b>" in results[0]["title_snippet"]
+
+    item_id = create_resp.json()["id"]
+    client.put(f"/items/{item_id}", headers=headers, json={"description": "Без покупок"})
+    client.delete(f"/items/{results[0]['id']}", headers=headers)
+
+    response = client.get("/items/search", headers=headers, params={"q": "молоко"})
+    assert response.status_code == 200
+    assert response.json() == []
+
+    response = client.get("/items/search", headers=headers, params={"q": 'AND "('})
+    assert response.status_code == 200
+
+    # Item text is escaped; only the match highlighting is markup
+    client.post("/items/", headers=headers, json={"title": "<script>alert(1)</script> кефир"})
+    results = client.get("/items/search", headers=headers, params={"q": "кефир"}).json()
+    assert results[0]["title_snippet"] == "&lt;script&gt;alert(1)&lt;/script&gt; <b>кефир</b>"
+    assert results[0]["title"] == "<script>alert(1)</script> кефир"
+
+    for params in ({"skip": -1}, {"limit": 0}, {"limit": 101}):
+        response = client.get("/items/search", headers=headers, params={"q": "кефир", **params})
+        assert response.status_code == 422
+
+
+def test_item_changes_feed(setup_db):
+    """Тест получения изменений задач после версии."""
+    client.post("/register", json={
+        "username": "user6",
+        "email": "user6@example.com",
+        "password": "pass123"
+    })
+    login = client.post("/auth", json={"username": "user6", "password": "pass123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    first = client.post("/items/", headers=headers, json={"title": "Первая"}).json()
+    second = client.post("/items/", headers=headers, json={"title": "Вторая"}).json()
+    assert second["version"] > first["version"]
+    assert first["created_at"] is not None
+
+    response = client.get("/items/changes", headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["id"] for item in data["items"]] == [first["id"], second["id"]]
+    assert data["deleted"] == []
+    assert data["has_more"] is False
+    since = data["version"]
+
+    client.put(f"/items/{first['id']}", headers=headers, json={"completed": True})
+    client.delete(f"/items/{second['id']}", headers=headers)
+
+    data = client.get("/items/changes", headers=headers, params={"since": since}).json()
+    assert [item["id"] for item in data["items"]] == [first["id"]]
+    assert data["items"][0]["completed"] is True
+    assert [tombstone["item_id"] for tombstone in data["deleted"]] == [second["id"]]
+    assert data["version"] > since
+
+    data = client.get("/items/changes", headers=headers, params={"limit": 1}).json()
+    assert data["has_more"] is True
+    assert len(data["items"]) + len(data["deleted"]) == 1
+
+
+def test_item_changes_write_between_reads(setup_db):
+    """Тест: запись между чтениями ленты изменений не теряется."""
+    client.post("/register", json={
+        "username": "user17",
+        "email": "user17@example.com",
+        "password": "pass123"
+    })
+    login = client.post("/auth", json={"username": "user17", "password": "pass123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    client.post("/items/", headers=headers, json={"title": "Первая"})
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+
+    written = []
+
+    def write_before_tombstones(conn, cursor, statement, parameters, context, executemany):
+        if "FROM todo_item_tombstones" in statement and not written:
+            writer = TestingSessionLocal()
+            try:
+                item = crud.create_todo_item(writer, schemas.TodoItemCreate(title="Между чтениями"), user_id)
+                written.append(item.id)
+            finally:
+                writer.close()
+
+    db = TestingSessionLocal()
+    event.listen(engine, "before_cursor_execute", write_before_tombstones)
+    try:
+        data = crud.get_todo_changes(db, user_id=user_id)
+    finally:
+        event.remove(engine, "before_cursor_execute", write_before_tombstones)
+        db.close()
+    assert written
+
+    data = client.get("/items/changes", headers=headers, params={"since": data["version"]}).json()
+    assert [item["id"] for item in data["items"]] == written
+
+
+def test_items_conditional_get(setup_db):
+    """Тест условного GET списка задач по ETag."""
+    client.post("/register", json={
+        "username": "user7",
+        "email": "user7@example.com",
+        "password": "pass123"
+    })
+    login = client.post("/auth", json={"username": "user7", "password": "pass123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    item_id = client.post("/items/", headers=headers, json={"title": "Задача"}).json()["id"]
+
+    response = client.get("/items/", headers=headers)
+    etag = response.headers["etag"]
+
+    for url in ("/items/", "/items/my/", f"/items/{item_id}"):
+        response = client.get(url, headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        assert response.content == b""
+    # A current collection ETag does not hide a missing item
+    response = client.get(f"/items/{item_id + 1000}", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 404
+
+    client.put(f"/items/{item_id}", headers=headers, json={"completed": True})
+
+    response = client.get("/items/", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()[0]["completed"] is True
+
+
+def test_items_summary(setup_db):
+    """Тест счетчиков задач пользователя и их сверки."""
+    client.post("/register", json={
+        "username": "user8",
+        "email": "user8@example.com",
+        "password": "pass123"
+    })
+    login = client.post("/auth", json={"username": "user8", "password": "pass123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    response = client.get("/items/summary", headers=headers)
+    assert response.json() == {"total": 0, "completed": 0, "pending": 0}
+
+    first = client.post("/items/", headers=headers, json={"title": "Первая"}).json()
+    second = client.post("/items/", headers=headers, json={"title": "Вторая", "completed": True}).json()
+    client.post("/items/", headers=headers, json={"title": "Третья"})
+    client.put(f"/items/{first['id']}", headers=headers, json={"completed": True})
+    client.put(f"/items/{first['id']}", headers=headers, json={"completed": True})
+    client.delete(f"/items/{second['id']}", headers=headers)
+
+    response = client.get("/items/summary", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"total": 2, "completed": 1, "pending": 1}
+
+    db = TestingSessionLocal()
+    try:
+        assert crud.reconcile_todo_summaries(db) == []
+        db.query(models.TodoSummary).update({"total": 10})
+        db.commit()
+        drift = crud.reconcile_todo_summaries(db, fix=True)
+        assert [row["actual"] for row in drift] == [(2, 1)]
+        assert crud.reconcile_todo_summaries(db) == []
+
+        # An item created between the drift check and the fix is not overwritten
+        db.query(models.TodoSummary).update({"total": 10})
+        db.commit()
+        owner_id = drift[0]["owner_id"]
+        raced = []
+
+        def concurrent_create(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("INSERT INTO todo_summaries") and "excluded.total" in statement and not raced:
+                raced.append(True)
+                with TestingSessionLocal() as other:
+                    crud.create_todo_item(other, schemas.TodoItemCreate(title="Параллельная"), user_id=owner_id)
+
+        event.listen(engine, "before_cursor_execute", concurrent_create)
+        try:
+            crud.reconcile_todo_summaries(db, fix=True)
+        finally:
+            event.remove(engine, "before_cursor_execute", concurrent_create)
+        assert raced
+        assert crud.reconcile_todo_summaries(db) == []
+    finally:
+        db.close()
+    assert client.get("/items/summary", headers=headers).json() == {"total": 3, "completed": 1, "pending": 2}
+
+
+def test_update_recreates_missing_summary(setup_db):
+    """Тест: изменение completed не теряется, если строки счетчиков нет."""
+    client.post("/register", json={
+        "username": "user18",
+        "email": "user18@example.com",
+        "password": "pass123"
+    })
+    login = client.post("/auth", json={"username": "user18", "password": "pass123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    item = client.post("/items/", headers=headers, json={"title": "Задача"}).json()
+
+    db = TestingSessionLocal()
+    try:
+        db.query(models.TodoSummary).delete()
+        db.commit()
+    finally:
+        db.close()
+
+    client.put(f"/items/{item['id']}", headers=headers, json={"completed": True})
+    assert client.get("/items/summary", headers=headers).json()["completed"] == 1
+
+
+def test_stateless_auth_and_revocation(setup_db, monkeypatch):
+    """Тест аутентификации по claims токена без запроса пользователя и отзыва токенов."""
+    monkeypatch.setattr(ENV, "STATELESS_AUTH", True)
+    client.post("/register", json={
+        "username": "user9",
+        "email": "user9@example.com",
+        "password": "pass123"
+    })
+    login = client.post("/auth", json={"username": "user9", "password": "pass123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    # The revocation list is re-read at most once per REVOCATION_POLL_SECONDS
+    monkeypatch.setattr(auth, "revocations", auth.RevocationList(ttl_seconds=60, poll_seconds=60))
+    assert client.get("/items/summary", headers=headers).status_code == 200
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        response = client.get("/items/summary", headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+    assert response.status_code == 200
+    assert not any("FROM users" in statement for statement in statements)
+
+    db = TestingSessionLocal()
+    try:
+        user_id = crud.get_user_by_username(db, "user9").id
+        crud.set_user_active(db, user_id, False)
+    finally:
+        db.close()
+
+    response = client.get("/items/summary", headers=headers)
+    assert response.status_code == 401
+
+    # Reactivation within the same second must not keep rejecting fresh tokens
+    db = TestingSessionLocal()
+    try:
+        crud.set_user_active(db, user_id, True)
+    finally:
+        db.close()
+    login = client.post("/auth", json={"username": "user9", "password": "pass123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    assert client.get("/items/summary", headers=headers).status_code == 200
+
+    # A deactivation committed by another process reaches this worker through the DB
+    monkeypatch.setattr(auth, "revocations", auth.RevocationList(ttl_seconds=60, poll_seconds=0))
+    db = TestingSessionLocal()
+    try:
+        db.execute(update(models.User).where(models.User.id == user_id).values(
+            is_active=False, tokens_revoked_at=int(time.time())
+        ))
+        db.commit()
+    finally:
+        db.close()
+    assert client.get("/items/summary", headers=headers).status_code == 401
+
+    monkeypatch.setattr(users, "SessionLocal", TestingSessionLocal)
+    assert users.main(["activate", "user9"]) == 0
+    login = client.post("/auth", json={"username": "user9", "password": "pass123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    assert client.get("/items/summary", headers=headers).status_code == 200
+    assert users.main(["deactivate", "user9"]) == 0
+    assert client.get("/items/summary", headers=headers).status_code == 401
+
+
+def test_item_writes_do_not_reselect(setup_db):
+    """Тест: запись задачи не перечитывает строку отдельным SELECT."""
+    client.post("/register", json={
+        "username": "user10",
+        "email": "user10@example.com",
+        "password": "pass123"
+    })
+    login = client.post("/auth", json={"username": "user10", "password": "pass123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    statements = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record_statement)
+    try:
+        item_id = client.post("/items/", headers=headers, json={"title": "Задача"}).json()["id"]
+        client.put(f"/items/{item_id}", headers=headers, json={"completed": True})
+        client.delete(f"/items/{item_id}", headers=headers)
+        missing = client.put(f"/items/{item_id}", headers=headers, json={"completed": False})
+    finally:
+        event.remove(engine, "before_cursor_execute", record_statement)
+
+    assert missing.status_code == 404
+    assert not any(
+        statement.startswith("SELECT") and "FROM todo_items" in statement
+        for statement in statements
+    )
+
+
+def test_export_and_import_items(setup_db):
+    """Тест потокового экспорта и импорта задач в NDJSON."""
+    client.post("/register", json={
+        "username": "user11",
+        "email": "user11@example.com",
+        "password": "pass123"
+    })
+    login = client.post("/auth", json={"username": "user11", "password": "pass123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    body = "\n".join(
+        json.dumps({"title": f"Задача {i}", "completed": i % 2 == 0}, ensure_ascii=False)
+        for i in range(5)
+    )
+    response = client.post(
+        "/items/import",
+        headers={**headers, "Content-Encoding": "gzip"},
+        content=gzip.compress(body.encode())
+    )
+    assert response.status_code == 200
+    assert response.json() == {"imported": 5}
+
+    summary = client.get("/items/summary", headers=headers).json()
+    assert summary == {"total": 5, "completed": 3, "pending": 2}
+
+    response = client.get("/items/export", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["title"] for line in lines] == [f"Задача {i}" for i in range(5)]
+
+    response = client.get("/items/export", headers=headers, params={"gzip": True})
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.text.splitlines()) == 5
+
+    response = client.post("/items/import", headers=headers, content=b'{"title": "ok"}\n{"completed": true}\n')
+    assert response.status_code == 400
+    assert "line 2" in response.json()["detail"]
+
+
+def test_fast_json_items_match_schema(setup_db, monkeypatch):
+    """Тест: быстрый путь сериализации отдает тот же JSON и ETag, что и обычный."""
+    client.post("/register", json={
+        "username": "user12",
+        "email": "user12@example.com",
+        "password": "pass123"
+    })
+    login = client.post("/auth", json={"username": "user12", "password": "pass123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    client.post("/items/", headers=headers, json={"title": "Первая", "description": "Описание"})
+    client.post("/items/", headers=headers, json={"title": "Вторая", "completed": True})
+
+    expected = {url: client.get(url, headers=headers) for url in ("/items/", "/items/my/?completed=true")}
+
+    monkeypatch.setattr(ENV, "FAST_JSON", True)
+    for url, slow in expected.items():
+        fast = client.get(url, headers=headers)
+        assert fast.status_code == 200
+        assert fast.json() == slow.json()
+        assert fast.headers["etag"] == slow.headers["etag"]
+
+
+def test_metrics_endpoint(setup_db):
+    """Тест метрик в формате Prometheus."""
+    client.post("/register", json={
+        "username": "user13",
+        "email": "user13@example.com",
+        "password": "pass123"
+    })
+    login = client.post("/auth", json={"username": "user13", "password": "pass123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    client.get("/items/42", headers=headers)
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert "# TYPE http_request_duration_seconds histogram" in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/items/{item_id}",status="404"}' in text
+    assert 'password_hash_duration_seconds_count{operation="hash"}' in text
+    assert 'password_hash_duration_seconds_count{operation="verify"}' in text
+    assert "http_requests_in_flight 1" in text
+
+
+def test_item_changes_after_tombstone_pruning(setup_db):
+    """Тест: после удаления старых надгробий отставший курсор получает 410."""
+    client.post("/register", json={
+        "username": "user20",
+        "email": "user20@example.com",
+        "password": "pass123"
+    })
+    login = client.post("/auth", json={"username": "user20", "password": "pass123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    first = client.post("/items/", headers=headers, json={"title": "Первая"}).json()
+    second = client.post("/items/", headers=headers, json={"title": "Вторая"}).json()
+    client.delete(f"/items/{second['id']}", headers=headers)
+    cursor = client.get("/items/changes", headers=headers).json()["version"]
+
+    db = TestingSessionLocal()
+    try:
+        assert crud.prune_tombstones(db, datetime.utcnow() - timedelta(days=1)) == 0
+        assert crud.prune_tombstones(db, datetime.utcnow() + timedelta(seconds=1)) == 1
+    finally:
+        db.close()
+
+    # A cursor from before the pruned delete cannot learn about it
+    response = client.get(f"/items/changes?since={first['version']}", headers=headers)
+    assert response.status_code == 410
+    response = client.get("/items/stream", headers={**headers, "Last-Event-ID": str(first["version"])})
+    assert response.status_code == 410
+    assert events.broker._subscribers == {}
+    # Cursors past it and full resyncs still work
+    assert client.get(f"/items/changes?since={cursor}", headers=headers).status_code == 200
+    changes = client.get("/items/changes?since=0", headers=headers).json()
+    assert [item["id"] for item in changes["items"]] == [first["id"]]
+    assert changes["deleted"] == []
+
+
+def test_item_changes_include_archived(setup_db, monkeypatch):
+    """Тест: задача, перенесенная в архив, остается в ленте изменений и в SSE."""
+    client.post("/register", json={
+        "username": "user21",
+        "email": "user21@example.com",
+        "password": "pass123"
+    })
+    login = client.post("/auth", json={"username": "user21", "password": "pass123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    item = client.post("/items/", headers=headers, json={"title": "Черновик"}).json()
+    cursor = client.get("/items/changes", headers=headers).json()["version"]
+    updated = client.put(f"/items/{item['id']}", headers=headers, json={"title": "Готово", "completed": True}).json()
+
+    db = TestingSessionLocal()
+    try:
+        assert crud.archive_completed_items(db, datetime.utcnow() + timedelta(seconds=1)) == 1
+    finally:
+        db.close()
+
+    for since in (cursor, 0):
+        changes = client.get(f"/items/changes?since={since}", headers=headers).json()
+        assert [(i["id"], i["title"], i["version"]) for i in changes["items"]] == [
+            (item["id"], "Готово", updated["version"])
+        ]
+        assert changes["version"] >= updated["version"]
+
+    monkeypatch.setattr(events, "SUBSCRIBER_BUFFER", 1)
+    client.post("/items/", headers=headers, json={"title": "Новая"})
+    with client.stream("GET", "/items/stream", headers={**headers, "Last-Event-ID": str(cursor)}) as response:
+        body = response.read().decode()
+    blocks = [block for block in body.split("\n\n") if block]
+    assert blocks[1].startswith(f"id: {updated['version']}\nevent: update\ndata: ")
+    assert json.loads(blocks[1].split("data: ", 1)[1])["title"] == "Готово"
+
+
+def test_item_stream_replay(setup_db, monkeypatch):
+    """Тест SSE: догоняющая выдача по Last-Event-ID и событие overflow."""
+    client.post("/register", json={
+        "username": "user14",
+        "email": "user14@example.com",
+        "password": "pass123"
+    })
+    login = client.post("/auth", json={"username": "user14", "password": "pass123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    first = client.post("/items/", headers=headers, json={"title": "Первая"}).json()
+    second = client.post("/items/", headers=headers, json={"title": "Вторая"}).json()
+    client.delete(f"/items/{second['id']}", headers=headers)
+
+    # A replay larger than the buffer ends the stream with overflow
+    monkeypatch.setattr(events, "SUBSCRIBER_BUFFER", 1)
+    with client.stream("GET", "/items/stream", headers={**headers, "Last-Event-ID": "0"}) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        body = response.read().decode()
+
+    blocks = [block for block in body.split("\n\n") if block]
+    assert blocks[0] == "retry: 3000"
+    assert blocks[1].startswith(f"id: {first['version']}\nevent: update\ndata: ")
+    assert json.loads(blocks[1].split("data: ", 1)[1])["title"] == "Первая"
+    assert blocks[2] == f'id: {first["version"]}\nevent: overflow\ndata: {{"since": {first["version"]}}}'
+
+
+def test_item_stream_releases_connection(setup_db):
+    """Тест SSE: открытый поток не держит соединение из пула."""
+    client.post("/register", json={
+        "username": "user19",
+        "email": "user19@example.com",
+        "password": "pass123"
+    })
+    token = client.post("/auth", json={"username": "user19", "password": "pass123"}).json()["access_token"]
+    payload = auth.decode_access_token(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+
+    async def scenario():
+        response = await stream_items(last_event_id=0, payload=payload, db=TestingSessionLocal())
+        assert engine.pool.checkedout() == 0
+        assert await response.body_iterator.__anext__() == "retry: 3000\n\n"
+        await response.body_iterator.aclose()
+
+    asyncio.run(scenario())
+    assert events.broker._subscribers == {}
+
+
+def test_item_stream_out_of_order_events(setup_db):
+    """Тест SSE: живые события не по порядку версий отдаются с возрастающими id без пропусков."""
+    client.post("/register", json={
+        "username": "user22",
+        "email": "user22@example.com",
+        "password": "pass123"
+    })
+    login = client.post("/auth", json={"username": "user22", "password": "pass123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    created = [client.post("/items/", headers=headers, json={"title": f"Задача {n}"}).json() for n in range(3)]
+    user_id, first = created[0]["owner_id"], created[0]["version"]
+
+    async def scenario():
+        subscriber = events.broker.subscribe(user_id)
+        body = sse_body(user_id, subscriber, None, first - 1, engine)
+        assert await body.__anext__() == "retry: 3000\n\n"
+        # The newest event arrives first: the versions before it are read from the DB
+        events.broker.publish(user_id, "update", first + 2, {"id": created[2]["id"]})
+        await asyncio.sleep(0)
+        chunks = [await body.__anext__() for _ in range(3)]
+        # Late events are already delivered; a batch is ordered by version
+        for version in (first + 1, first + 4, first, first + 3):
+            events.broker.publish(user_id, "update", version, {"version": version})
+        await asyncio.sleep(0)
+        chunks += [await body.__anext__() for _ in range(2)]
+        await body.aclose()
+        return [int(chunk.split("\n", 1)[0].removeprefix("id: ")) for chunk in chunks]
+
+    assert asyncio.run(scenario()) == [first, first + 1, first + 2, first + 3, first + 4]
+    assert events.broker._subscribers == {}
+
+
+def test_event_broker_overflow():
+    """Тест брокера событий: доставка по пользователю и отключение отстающего."""
+    async def scenario():
+        broker = events.Broker(buffer_size=2)
+        subscriber = broker.subscribe(1)
+        other = broker.subscribe(2)
+        broker.publish(1, "create", 1, {"id": 10})
+        await asyncio.sleep(0)
+        batch = await subscriber.next_batch(1)
+        assert [event["version"] for event in batch] == [1]
+        assert await other.next_batch(0.01) is None
+
+        for version in range(2, 6):
+            broker.publish(1, "update", version, {"id": 10})
+        await asyncio.sleep(0)
+        assert await subscriber.next_batch(1) == []
+        assert subscriber.dropped
+
+        broker.unsubscribe(1, subscriber)
+        broker.unsubscribe(2, other)
+        assert broker._subscribers == {}
+
+    asyncio.run(scenario())
+
+
+def test_archive_completed_items(setup_db):
+    """Тест переноса завершенных задач в архив и чтения обоих уровней."""
+    client.post("/register", json={
+        "username": "user15",
+        "email": "user15@example.com",
+        "password": "pass123"
+    })
+    login = client.post("/auth", json={"username": "user15", "password": "pass123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    done = client.post("/items/", headers=headers, json={"title": "Старая", "completed": True}).json()
+    other = client.post("/items/", headers=headers, json={"title": "Еще старая", "completed": True}).json()
+    open_item = client.post("/items/", headers=headers, json={"title": "Открытая"}).json()
+    etag = client.get("/items/", headers=headers).headers["etag"]
+
+    db = TestingSessionLocal()
+    try:
+        assert crud.archive_completed_items(db, datetime.utcnow() - timedelta(days=1)) == 0
+        assert crud.archive_completed_items(db, datetime.utcnow() + timedelta(seconds=1), batch_size=1) == 1
+        assert crud.archive_completed_items(db, datetime.utcnow() + timedelta(seconds=1)) == 1
+    finally:
+        db.close()
+
+    response = client.get("/items/", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert [item["id"] for item in response.json()] == [open_item["id"]]
+    response = client.get("/items/", headers=headers, params={"include_archived": True})
+    assert [item["id"] for item in response.json()] == [done["id"], other["id"], open_item["id"]]
+    response = client.get("/items/my/", headers=headers, params={"include_archived": True, "completed": True})
+    assert [item["id"] for item in response.json()] == [done["id"], other["id"]]
+    assert client.get(f"/items/{done['id']}", headers=headers).json()["title"] == "Старая"
+
+    # Reopening an archived item moves it back to the hot tier
+    response = client.put(f"/items/{done['id']}", headers=headers, json={"completed": False})
+    assert response.status_code == 200
+    assert response.json()["completed"] is False
+    assert client.delete(f"/items/{other['id']}", headers=headers).status_code == 200
+    assert client.get(f"/items/{other['id']}", headers=headers).status_code == 404
+
+    items = client.get("/items/", headers=headers).json()
+    assert sorted(item["id"] for item in items) == [done["id"], open_item["id"]]
+    assert client.get("/items/summary", headers=headers).json() == {"total": 2, "completed": 0, "pending": 2}
+    db = TestingSessionLocal()
+    try:
+        assert crud.reconcile_todo_summaries(db) == []
+    finally:
+        db.close()
+
+
+def test_signed_request_profile(setup_db, monkeypatch):
+    """Тест профилирования запроса с подписанным заголовком X-Profile."""
+    monkeypatch.setattr(ENV, "PROFILE_SECRET", "profile-secret")
+    profiling.PROFILES.clear()
+    client.post("/register", json={
+        "username": "user16",
+        "email": "user16@example.com",
+        "password": "pass123"
+    })
+    token = profiling.sign("profile-secret", int(time.time()) + 60)
+    expired = profiling.sign("profile-secret", int(time.time()) - 1)
+    client.post("/auth", headers={"X-Profile": expired}, json={"username": "user16", "password": "pass123"})
+    assert len(profiling.PROFILES) == 0
+
+    response = client.post("/auth", headers={"X-Profile": token}, json={"username": "user16", "password": "pass123"})
+    assert response.status_code == 200
+    # Streaming routes are never profiled
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}", "X-Profile": token}
+    assert client.get("/items/export", headers=headers).status_code == 200
+
+    profiles = client.get("/admin/profiles", headers={"X-Profile": token}).json()
+    assert [profile["route"] for profile in profiles] == ["/auth"]
+    profile = profiles[0]
+    assert profile["reason"] == "header"
+    assert profile["timings_ms"]["argon2"] > 0
+    assert profile["sql"]["count"] >= 1
+    assert profile["samples"] > 0
+    assert "endpoint" in profile["phases_ms"]
+
+
+def test_schema_migration_from_initial_version(tmp_path):
+    """Тест: база первой версии схемы доводится до текущей один раз."""
+    old_engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with old_engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR(50) NOT NULL, "
+            "email VARCHAR(100) NOT NULL, hashed_password VARCHAR(255) NOT NULL, is_active BOOLEAN)"
+        )
+        conn.exec_driver_sql(
+            "CREATE TABLE todo_items (id INTEGER PRIMARY KEY, title VARCHAR(255) NOT NULL, "
+            "description TEXT, completed BOOLEAN, owner_id INTEGER REFERENCES users (id))"
+        )
+        conn.exec_driver_sql("INSERT INTO users VALUES (1, 'old', 'old@example.com', 'x', 1)")
+        conn.exec_driver_sql("INSERT INTO todo_items VALUES (1, 'Старая задача', NULL, 1, 1)")
+        conn.exec_driver_sql("INSERT INTO todo_items VALUES (2, 'Еще одна', NULL, 0, 1)")
+        # Left behind by an earlier, interrupted rebuild
+        conn.exec_driver_sql("CREATE TABLE todo_items_rebuild (id INTEGER PRIMARY KEY)")
+
+    assert migrations.ensure_schema(old_engine, Base.metadata, models.SCHEMA_VERSION, models.upgrade_schema) is True
+    assert migrations.ensure_schema(old_engine, Base.metadata, models.SCHEMA_VERSION, models.upgrade_schema) is False
+
+    db = sessionmaker(bind=old_engine)()
+    try:
+        # Rows written before versioning are numbered, so the change feed sees them
+        assert crud.get_items_version(db, 1) == 2
+        changes = crud.get_todo_changes(db, user_id=1, since=0)
+        assert [(item.id, item.version) for item in changes["items"]] == [(1, 1), (2, 2)]
+        assert changes["version"] == 2
+        assert [item["title"] for item in crud.search_todo_items(db, user_id=1, query="старая")] == ["Старая задача"]
+        crud.reconcile_todo_summaries(db, fix=True)
+        assert crud.get_todo_summary(db, 1) == {"total": 2, "completed": 1, "pending": 1}
+        # Legacy rows get timestamps, so the archiver can pick them up
+        assert crud.get_todo_item(db, item_id=1, user_id=1).updated_at is not None
+        assert crud.archive_completed_items(db, datetime.utcnow() + timedelta(seconds=1)) == 1
+    finally:
+        db.close()
+        old_engine.dispose()
+
+
+def test_schema_migration_concurrent_workers(tmp_path):
+    """Тест: воркеры, стартующие одновременно, мигрируют базу ровно один раз."""
+    old_engine = legacy_todo_engine(tmp_path / "old.db")
+    barrier = threading.Barrier(4)
+
+    def boot():
+        barrier.wait()
+        return migrations.ensure_schema(old_engine, Base.metadata, models.SCHEMA_VERSION, models.upgrade_schema)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda _: boot(), range(4)))
+    assert sorted(results) == [False, False, False, True]
+    with old_engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT count(*) FROM todo_items").scalar() == 3
+    old_engine.dispose()
+
+
+def legacy_todo_engine(path):
+    """База первой версии схемы: todo_items без AUTOINCREMENT, задачи 1..3 пользователя 1."""
+    old_engine = create_engine(f"sqlite:///{path}")
+    with old_engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR(50) NOT NULL, "
+            "email VARCHAR(100) NOT NULL, hashed_password VARCHAR(255) NOT NULL, is_active BOOLEAN)"
+        )
+        conn.exec_driver_sql(
+            "CREATE TABLE todo_items (id INTEGER PRIMARY KEY, title VARCHAR(255) NOT NULL, "
+            "description TEXT, completed BOOLEAN, owner_id INTEGER REFERENCES users (id))"
+        )
+        conn.exec_driver_sql("INSERT INTO users VALUES (1, 'old', 'old@example.com', 'x', 1)")
+        for item_id in (1, 2, 3):
+            conn.exec_driver_sql(f"INSERT INTO todo_items VALUES ({item_id}, 'Задача {item_id}', NULL, 1, 1)")
+    return old_engine
+
+
+def test_archive_ids_not_reused_after_migration(tmp_path):
+    """Тест: после миграции id архивных задач не выдаются повторно, без нее архиватор не работает."""
+    unmigrated = legacy_todo_engine(tmp_path / "unmigrated.db")
+    migrations.ensure_schema(unmigrated, Base.metadata, models.SCHEMA_VERSION)
+    db = sessionmaker(bind=unmigrated)()
+    try:
+        with pytest.raises(RuntimeError):
+            crud.archive_completed_items(db, datetime.utcnow())
+    finally:
+        db.close()
+        unmigrated.dispose()
+
+    old_engine = legacy_todo_engine(tmp_path / "old.db")
+    migrations.ensure_schema(old_engine, Base.metadata, models.SCHEMA_VERSION, models.upgrade_schema)
+    db = sessionmaker(bind=old_engine)()
+    try:
+        db.execute(update(models.TodoItem).values(updated_at=datetime.utcnow() - timedelta(days=1)))
+        db.commit()
+        assert crud.archive_completed_items(db, datetime.utcnow(), batch_size=1) == 1
+        assert crud.archive_completed_items(db, datetime.utcnow(), batch_size=5) == 2
+        item = crud.create_todo_item(db, schemas.TodoItemCreate(title="Новая"), user_id=1)
+        assert item.id == 4
+        ids = [row.id for row in crud.get_todo_items(db, user_id=1, include_archived=True)]
+        assert sorted(ids) == [1, 2, 3, 4]
+        assert [row["title"] for row in crud.search_todo_items(db, user_id=1, query="новая")] == ["Новая"]
+    finally:
+        db.close()
+        old_engine.dispose()
+
+
+def test_health_endpoint():
+    """Тест пробы готовности."""
+    response = client.get("/health")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ok"
+    assert "imported" in response.json()["startup"]
+
+
+def test_admission_limit_adapts_and_sheds():
+    """Тест адаптивного лимита: рост на быстрых ответах, снижение на медленных, 503 сверх лимита."""
+    limit = admission.AIMDLimit(initial=2, min_limit=1, max_limit=3, target_latency=0.1)
+    assert limit.try_acquire() and limit.try_acquire()
+    assert not limit.try_acquire()
+    limit.release(0.01, now=1.0)
+    limit.release(0.01, now=1.0)
+    assert limit.limit == 2.5
+    # Slow responses finishing together back off once per target latency
+    for _ in range(2):
+        limit.try_acquire()
+    limit.release(0.5, now=2.0)
+    limit.release(0.5, now=2.0)
+    assert limit.limit == 2.5 * admission.BACKOFF
+
+    release = asyncio.Event()
+
+    async def slow_app(scope, receive, send):
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    class Settings:
+        ADMISSION_CONTROL = True
+        ADMISSION_READ_TARGET_MS = 50
+        ADMISSION_WRITE_TARGET_MS = 250
+
+    middleware = admission.AdmissionMiddleware(slow_app, Settings, exempt=("/health",))
+    middleware.limits["read"] = admission.AIMDLimit(initial=2, min_limit=1, max_limit=2, target_latency=10)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=middleware)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            held = [asyncio.create_task(http.get("/items/")) for _ in range(2)]
+            await asyncio.sleep(0.05)
+            shed = await http.get("/items/")
+            assert shed.status_code == 503
+            assert shed.headers["retry-after"] == "1"
+            exempt = asyncio.create_task(http.get("/health"))
+            release.set()
+            assert [response.status_code for response in await asyncio.gather(*held)] == [200, 200]
+            assert (await exempt).status_code == 200
+        assert middleware.limits["read"].in_flight == 0
+
+    asyncio.run(scenario())
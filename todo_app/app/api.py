@@ -1,27 +1,127 @@
+import asyncio
 from datetime import timedelta
 from typing import Optional
 
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
-from .database import engine, get_db
-from . import models, schemas, crud, auth
+from common import admission, metrics, migrations, profiling, startup
+from common.responses import FastJSONResponse
+
+from .database import REGISTRY, SessionLocal, engine, get_db
+from . import models, schemas, crud, auth, archive, events, ndjson
 from .config import ENV
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    models.Base.metadata.create_all(bind=engine)
+    if migrations.ensure_schema(engine, models.Base.metadata, models.SCHEMA_VERSION, models.upgrade_schema):
+        # Counters for items written before todo_summaries existed
+        with SessionLocal() as db:
+            crud.reconcile_todo_summaries(db, fix=True)
+    startup.mark("ready")
+    # Argon2 and JWT load in the background instead of delaying readiness
+    warm_up = asyncio.create_task(asyncio.to_thread(auth.warm_up))
+    archiver = None
+    if ENV.ARCHIVE_AFTER_DAYS:
+        archiver = asyncio.create_task(archive.run_periodically(
+            ENV.ARCHIVE_AFTER_DAYS, ENV.ARCHIVE_BATCH_SIZE, ENV.ARCHIVE_INTERVAL_SECONDS
+        ))
     yield
+    await warm_up
+    if archiver is not None:
+        archiver.cancel()
+        with suppress(asyncio.CancelledError):
+            await archiver
+
+# Long-lived streaming responses: neither profiled nor counted by admission control
+STREAMING_PATHS = ("/items/stream", "/items/export", "/items/import")
 
 app = FastAPI(
     lifespan=lifespan,
+    default_response_class=FastJSONResponse if ENV.FAST_JSON else JSONResponse,
     title="Todo API",
     description="API для управления задачами с аутентификацией",
     version="1.0.0",
 
 )
+app.add_middleware(metrics.MetricsMiddleware, registry=REGISTRY)
+app.add_middleware(profiling.ProfilingMiddleware, settings=ENV, exclude=("/admin/profiles",) + STREAMING_PATHS)
+app.add_middleware(startup.FirstRequestMiddleware)
+# Outermost, so that shed requests cost as little as possible
+app.add_middleware(
+    admission.AdmissionMiddleware,
+    settings=ENV,
+    exempt=("/health", "/metrics", "/admin/profiles") + STREAMING_PATHS,
+    registry=REGISTRY
+)
+
+
+def collection_etag(db: Session, user: schemas.User) -> str:
+    """ETag списка задач пользователя: меняется при любой записи в его задачах."""
+    if isinstance(user, models.User):
+        version = user.items_version
+    else:
+        # Stateless auth: the user row was not loaded for this request
+        version = crud.get_items_version(db, user.id)
+    return f'W/"{user.id}-{version}"'
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+
+def not_modified_response(request: Request, response: Response, db: Session, user: schemas.User):
+    """304-ответ, если у клиента актуальная версия; иначе проставляет ETag в ответ."""
+    etag = collection_etag(db, user)
+    if is_not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return None
+
+
+NOT_MODIFIED_RESPONSES = {304: {"description": "Not Modified"}}
+
+
+def fast_json_rows(rows, response: Response) -> FastJSONResponse:
+    """Быстрый путь (FAST_JSON): строки БД сразу в JSON, минуя response_model."""
+    return FastJSONResponse([row._asdict() for row in rows], headers=response.headers)
+
+# Размер пачки при потоковом экспорте и импорте задач
+NDJSON_BATCH_SIZE = 1000
+
+
+@app.get("/health", include_in_schema=False)
+async def health():
+    """Проба готовности без обращения к БД и без загрузки Argon2/JWT"""
+    return {"status": "ok", "startup": startup.REPORT}
+
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    return Response(REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/admin/profiles", include_in_schema=False)
+def read_profiles(x_profile: Optional[str] = Header(None)):
+    """Последние профили запросов, новые первыми; нужен подписанный заголовок X-Profile"""
+    if not profiling.verify(x_profile, ENV.PROFILE_SECRET):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return list(reversed(profiling.PROFILES))
+
 
 @app.post("/register", response_model=schemas.User)
 def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
@@ -49,13 +149,14 @@ def login_for_access_token(
         )
     access_token_expires = timedelta(minutes=ENV.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": user.username, "uid": user.id, "active": user.is_active},
+        expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @app.get("/users/me", response_model=schemas.User)
-def read_users_me(current_user: schemas.User = Depends(auth.get_current_active_user)):
+def read_users_me(current_user: schemas.User = Depends(auth.get_current_active_db_user)):
     return current_user
 
 
@@ -68,26 +169,251 @@ def create_item(
     return crud.create_todo_item(db=db, item=item, user_id=current_user.id)
 
 
-@app.get("/items/", response_model=list[schemas.TodoItem])
+@app.get("/items/", response_model=list[schemas.TodoItem], responses=NOT_MODIFIED_RESPONSES)
 def read_items(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    include_archived: bool = False,
     current_user: schemas.User = Depends(auth.get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    items = crud.get_todo_items(db, user_id=current_user.id, skip=skip, limit=limit)
+    """
+     include_archived: вместе с активными вернуть и перенесенные в архив
+                       давно завершенные задачи (по умолчанию только активные)
+    """
+    not_modified = not_modified_response(request, response, db, current_user)
+    if not_modified is not None:
+        return not_modified
+
+    if ENV.FAST_JSON:
+        rows = crud.get_todo_item_rows(
+            db, user_id=current_user.id, skip=skip, limit=limit, include_archived=include_archived
+        )
+        return fast_json_rows(rows, response)
+
+    items = crud.get_todo_items(
+        db, user_id=current_user.id, skip=skip, limit=limit, include_archived=include_archived
+    )
     return items
 
 
-@app.get("/items/{item_id}", response_model=schemas.TodoItem)
+@app.get("/items/search", response_model=list[schemas.TodoItemSearchResult])
+def search_items(
+    q: str = Query(..., min_length=1),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: schemas.User = Depends(auth.get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+     Полнотекстовый поиск по названию и описанию задач текущего пользователя.
+     Результаты отсортированы по релевантности, совпадения выделены в *_snippet.
+    """
+    return crud.search_todo_items(db, user_id=current_user.id, query=q, skip=skip, limit=limit)
+
+
+@app.get("/items/export", response_class=StreamingResponse)
+def export_items(
+    gzip: bool = False,
+    current_user: schemas.User = Depends(auth.get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+     Все задачи пользователя (и архивные) в формате NDJSON, потоком пачками по NDJSON_BATCH_SIZE.
+     gzip=true сжимает поток (Content-Encoding: gzip).
+    """
+    user_id = current_user.id
+    # Own session: the response outlives the request-scoped one
+    bind = db.get_bind()
+
+    def stream():
+        with Session(bind=bind) as export_db:
+            batches = crud.iter_todo_item_batches(export_db, user_id, batch_size=NDJSON_BATCH_SIZE)
+            yield from ndjson.encode_stream(batches, compress=gzip)
+
+    headers = {"Content-Encoding": "gzip"} if gzip else None
+    return StreamingResponse(stream(), media_type=ndjson.MEDIA_TYPE, headers=headers)
+
+
+@app.post("/items/import", response_model=schemas.TodoItemImportResult)
+async def import_items(
+    request: Request,
+    current_user: schemas.User = Depends(auth.get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+     Импорт задач из тела в формате NDJSON (можно с Content-Encoding: gzip).
+     Тело читается потоком, задачи вставляются и фиксируются пачками;
+     при ошибке в строке пачки до нее уже сохранены.
+    """
+    imported = 0
+    batch = []
+    async for line_no, line in ndjson.iter_lines(request):
+        try:
+            batch.append(schemas.TodoItemCreate.model_validate_json(line))
+        except ValidationError as exc:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid item on line {line_no}: {exc.errors()[0]['msg']}; "
+                       f"{imported} items imported before it"
+            )
+        if len(batch) >= NDJSON_BATCH_SIZE:
+            imported += await run_in_threadpool(crud.bulk_create_todo_items, db, batch, current_user.id)
+            batch = []
+    imported += await run_in_threadpool(crud.bulk_create_todo_items, db, batch, current_user.id)
+    return {"imported": imported}
+
+
+@app.get("/items/summary", response_model=schemas.TodoSummary)
+def read_items_summary(
+    current_user: schemas.User = Depends(auth.get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    return crud.get_todo_summary(db, user_id=current_user.id)
+
+
+CHANGES_GONE_DETAIL = "Changes since this version were pruned, resync from since=0"
+
+
+@app.get("/items/changes", response_model=schemas.TodoItemChanges)
+def read_item_changes(
+    since: int = 0,
+    limit: int = Query(500, ge=1, le=1000),
+    current_user: schemas.User = Depends(auth.get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+     Изменения задач после версии since: измененные задачи и удаленные (deleted).
+     Следующий запрос делается с since=version из ответа, пока has_more == True.
+     410 — надгробия после since уже удалены: нужна полная синхронизация с since=0.
+    """
+    changes = crud.get_todo_changes(db, user_id=current_user.id, since=since, limit=limit)
+    if changes is None:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail=CHANGES_GONE_DETAIL)
+    return changes
+
+
+SSE_RETRY_MS = 3000
+SSE_KEEPALIVE_SECONDS = 15
+
+
+def read_changes(bind, user_id: int, since: int) -> Optional[dict]:
+    with Session(bind=bind) as db:
+        return crud.get_todo_changes(db, user_id, since, events.SUBSCRIBER_BUFFER)
+
+
+async def sse_body(user_id: int, subscriber: events.Subscriber, replay: Optional[dict], cursor: int, bind):
+    """
+    cursor — версия, до которой клиент уже все получил (Last-Event-ID, итог
+    догоняющей выдачи или версия на момент подписки). id в потоке строго
+    возрастают, поэтому Last-Event-ID никогда не перескакивает через версию.
+    Живые события публикуются после коммита из разных потоков и могут прийти
+    не по порядку; если между cursor и событием есть пропуск (событие еще в
+    пути или версия без события, как при архивировании), пропущенное
+    дочитывается из БД: все версии до опубликованной уже закоммичены.
+    """
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        if replay is not None:
+            for event in events.replay_events(replay):
+                yield events.format_event(event)
+            cursor = replay["version"]
+            if replay["has_more"]:
+                yield events.format_event(events.overflow_event(cursor))
+                return
+
+        while True:
+            batch = await subscriber.next_batch(SSE_KEEPALIVE_SECONDS)
+            if batch is None:
+                # Comment line keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                continue
+            for event in sorted(batch, key=lambda event: event["version"]):
+                # Already delivered by the replay or a catch-up
+                if event["version"] <= cursor:
+                    continue
+                if event["version"] > cursor + 1:
+                    replay = await run_in_threadpool(read_changes, bind, user_id, cursor)
+                    if replay is None or replay["has_more"]:
+                        yield events.format_event(events.overflow_event(cursor))
+                        return
+                    for replayed in events.replay_events(replay):
+                        yield events.format_event(replayed)
+                    cursor = replay["version"]
+                    if event["version"] <= cursor:
+                        continue
+                yield events.format_event(event)
+                cursor = event["version"]
+            if subscriber.dropped:
+                # Events up to the cursor are the only ones known to be delivered
+                yield events.format_event(events.overflow_event(cursor))
+                return
+    finally:
+        events.broker.unsubscribe(user_id, subscriber)
+
+
+@app.get("/items/stream", response_class=StreamingResponse)
+async def stream_items(
+    last_event_id: Optional[int] = Header(None),
+    payload: dict = Depends(auth.decode_access_token),
+    db: Session = Depends(get_db)
+):
+    """
+     Изменения задач в реальном времени (text/event-stream).
+     id события — версия задачи; после переподключения с заголовком Last-Event-ID
+     сначала отдаются пропущенные изменения. Событие overflow означает, что клиент
+     отстал: нужно переподключиться с Last-Event-ID из него. 410 — как у
+     /items/changes: пропущенные удаления уже забыты, нужна полная синхронизация.
+    """
+    # The stream outlives the request: the session is used only to set it up
+    # and is closed before returning, so open streams hold no pooled connection
+    bind = db.get_bind()
+    try:
+        current_user = await run_in_threadpool(auth.get_current_active_user, payload, db)
+        # Subscribe before the replay so nothing written in between is lost
+        subscriber = events.broker.subscribe(current_user.id)
+        replay = None
+        try:
+            if last_event_id is not None:
+                replay = await run_in_threadpool(
+                    crud.get_todo_changes, db, current_user.id, last_event_id, events.SUBSCRIBER_BUFFER
+                )
+                if replay is None:
+                    raise HTTPException(status_code=status.HTTP_410_GONE, detail=CHANGES_GONE_DETAIL)
+                cursor = last_event_id
+            else:
+                # Only changes from now on; earlier ones are already committed
+                cursor = await run_in_threadpool(crud.get_items_version, db, current_user.id)
+        except BaseException:
+            events.broker.unsubscribe(current_user.id, subscriber)
+            raise
+    finally:
+        db.close()
+
+    return StreamingResponse(
+        sse_body(current_user.id, subscriber, replay, cursor, bind),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/items/{item_id}", response_model=schemas.TodoItem, responses=NOT_MODIFIED_RESPONSES)
 def read_item(
     item_id: int,
+    request: Request,
+    response: Response,
     current_user: schemas.User = Depends(auth.get_current_active_user),
     db: Session = Depends(get_db)
 ):
     db_item = crud.get_todo_item(db, item_id=item_id, user_id=current_user.id)
     if db_item is None:
         raise HTTPException(status_code=404, detail="Item not found")
+
+    not_modified = not_modified_response(request, response, db, current_user)
+    if not_modified is not None:
+        return not_modified
     return db_item
 
 
@@ -118,9 +444,12 @@ def delete_item(
     return {"message": "Item deleted successfully"}
 
 
-@app.get("/items/my/", response_model=list[schemas.TodoItem])
+@app.get("/items/my/", response_model=list[schemas.TodoItem], responses=NOT_MODIFIED_RESPONSES)
 def read_my_items(
+        request: Request,
+        response: Response,
         completed: Optional[bool] = None,
+        include_archived: bool = False,
         current_user: schemas.User = Depends(auth.get_current_active_user),
         db: Session = Depends(get_db)
 ):
@@ -129,11 +458,29 @@ def read_my_items(
                 если True - вернуть только завершенные задачи,
                  если False - вернуть только незавершенные задачи,
                  если None - вернуть все задачи (по умолчанию)
+     include_archived: учитывать и задачи из архива
     """
-    all_items = crud.get_todo_items(db, user_id=current_user.id, skip=0, limit=100)
+    not_modified = not_modified_response(request, response, db, current_user)
+    if not_modified is not None:
+        return not_modified
+
+    if ENV.FAST_JSON:
+        rows = crud.get_todo_item_rows(
+            db, user_id=current_user.id, skip=0, limit=100, include_archived=include_archived
+        )
+        if completed is not None:
+            rows = [row for row in rows if row.completed == completed]
+        return fast_json_rows(rows, response)
+
+    all_items = crud.get_todo_items(
+        db, user_id=current_user.id, skip=0, limit=100, include_archived=include_archived
+    )
 
     if completed is not None:
         filtered_items = [item for item in all_items if item.completed == completed]
         return filtered_items
 
-    return all_items
\ No newline at end of file
+    return all_items
+
+
+startup.mark("imported")
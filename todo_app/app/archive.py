@@ -0,0 +1,91 @@
+"""
+Перенос давно завершенных задач из todo_items в todo_items_archive и
+удаление надгробий (tombstones) удаленных задач старше того же порога.
+
+Работает фоновой задачей приложения (каждые ENV.ARCHIVE_INTERVAL_SECONDS)
+или вручную из каталога todo_app:
+    python -m app.archive --days 90      # по умолчанию ENV.ARCHIVE_AFTER_DAYS (0 — выключено)
+
+Задачи переносятся пачками по ENV.ARCHIVE_BATCH_SIZE, каждая пачка — своя
+короткая транзакция, чтобы не держать блокировку записи SQLite. Клиент
+синхронизации, чей курсор старше удаленных надгробий, получает от
+/items/changes ответ 410 и начинает заново с since=0.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import datetime, timedelta
+
+from fastapi.concurrency import run_in_threadpool
+
+from .config import ENV
+from .database import SessionLocal
+from . import crud
+
+logger = logging.getLogger(__name__)
+
+
+def archive_batch(days: int, batch_size: int) -> int:
+    db = SessionLocal()
+    try:
+        completed_before = datetime.utcnow() - timedelta(days=days)
+        return crud.archive_completed_items(db, completed_before, batch_size=batch_size)
+    finally:
+        db.close()
+
+
+def prune_batch(days: int, batch_size: int) -> int:
+    db = SessionLocal()
+    try:
+        deleted_before = datetime.utcnow() - timedelta(days=days)
+        return crud.prune_tombstones(db, deleted_before, batch_size=batch_size)
+    finally:
+        db.close()
+
+
+def run_all(step, days: int, batch_size: int) -> int:
+    done = 0
+    while True:
+        batch = step(days, batch_size)
+        done += batch
+        if batch < batch_size:
+            return done
+
+
+async def run_periodically(days: int, batch_size: int, interval: float) -> None:
+    """Фоновая задача lifespan: пачки в пуле потоков, между ними отдаем цикл событий."""
+    while True:
+        for step, message in ((archive_batch, "archived %d completed todo items"),
+                              (prune_batch, "pruned %d todo item tombstones")):
+            done = 0
+            try:
+                while True:
+                    batch = await run_in_threadpool(step, days, batch_size)
+                    done += batch
+                    if batch < batch_size:
+                        break
+                    await asyncio.sleep(0)
+            except Exception:
+                logger.exception("todo archiver failed; retrying in %s s", interval)
+            if done:
+                logger.info(message, done)
+        await asyncio.sleep(interval)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Move long-completed todo items to the archive table and prune old tombstones")
+    parser.add_argument("--days", type=int, default=ENV.ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ENV.ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args(argv)
+    if args.days <= 0:
+        parser.error("--days must be positive (ARCHIVE_AFTER_DAYS is 0: archiving is off)")
+
+    moved = run_all(archive_batch, args.days, args.batch_size)
+    pruned = run_all(prune_batch, args.days, args.batch_size)
+    print(f"{moved} items archived, {pruned} tombstones pruned")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
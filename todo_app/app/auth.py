@@ -1,13 +1,17 @@
+import threading
+import time
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from jose import JWTError
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 
+from common import profiling
+
 from . import models, schemas
-from .database import get_db
+from .database import REGISTRY, get_db
 from .config import ENV
 
 security = HTTPBearer()
@@ -16,15 +20,106 @@ SECRET_KEY = ENV.SECRET_KEY
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+
+# passlib/argon2 and jose.jwt are imported on first use (or by warm_up), so
+# they stay out of the import path of the app and of its health probes.
+@lru_cache(maxsize=None)
+def password_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["argon2"], deprecated="auto")
+
+
+def warm_up() -> None:
+    """Загрузить лениво импортируемые зависимости до первого запроса."""
+    password_context()
+    from jose import jwt  # noqa: F401
+
+
+class RevocationList:
+    """
+    Пользователи, чьи токены выпущены до момента отзыва, считаются недействительными.
+    Источник истины — users.tokens_revoked_at: set_user_active пишет его в БД,
+    а каждый процесс перечитывает отзывы не чаще раза в poll_seconds (sync).
+    Отзыв из другого процесса или воркера начинает действовать здесь не позже
+    чем через poll_seconds, в своем процессе — сразу.
+    Запись живет не дольше срока жизни токена, после этого все токены,
+    выпущенные до отзыва, истекают сами. Моменты хранятся в целых секундах,
+    как claim iat.
+    """
+
+    def __init__(self, ttl_seconds: float, poll_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.poll_seconds = poll_seconds
+        self._revoked_at: dict[int, int] = {}
+        self._synced_at = float("-inf")
+        # Called from threadpool workers (sync dependencies and endpoints)
+        self._lock = threading.Lock()
+
+    def sync(self, db: Session) -> None:
+        """Перечитать отзывы из БД, если с прошлого раза прошло poll_seconds."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._synced_at < self.poll_seconds:
+                return
+            # Other threads keep the current list instead of queueing on the query
+            self._synced_at = now
+        rows = db.query(models.User.id, models.User.tokens_revoked_at).filter(
+            models.User.tokens_revoked_at >= int(time.time() - self.ttl_seconds)
+        ).all()
+        with self._lock:
+            self._revoked_at = {user_id: revoked_at for user_id, revoked_at in rows}
+
+    def revoke(self, user_id: int, revoked_at: int) -> None:
+        with self._lock:
+            self._purge(int(time.time()))
+            self._revoked_at[user_id] = revoked_at
+
+    def restore(self, user_id: int) -> None:
+        """Снять отзыв: пользователь снова активен, его токены опять действительны."""
+        with self._lock:
+            self._revoked_at.pop(user_id, None)
+
+    def is_revoked(self, user_id: int, issued_at: int) -> bool:
+        with self._lock:
+            revoked_at = self._revoked_at.get(user_id)
+            if revoked_at is None:
+                return False
+            if time.time() - revoked_at > self.ttl_seconds:
+                self._revoked_at.pop(user_id, None)
+                return False
+            # A token from the second of the revocation may predate it: reject it too
+            return int(issued_at) <= revoked_at
+
+    def _purge(self, now: float) -> None:
+        expired = [
+            user_id for user_id, revoked_at in self._revoked_at.items()
+            if now - revoked_at > self.ttl_seconds
+        ]
+        for user_id in expired:
+            self._revoked_at.pop(user_id, None)
+
+    def __len__(self) -> int:
+        return len(self._revoked_at)
+
+
+revocations = RevocationList(
+    ttl_seconds=ENV.ACCESS_TOKEN_EXPIRE_MINUTES * 60, poll_seconds=ENV.REVOCATION_POLL_SECONDS
+)
+
+
+PASSWORD_HASH_DURATION = REGISTRY.histogram(
+    "password_hash_duration_seconds", "Argon2 hashing time by operation", ("operation",)
+)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    with PASSWORD_HASH_DURATION.time(("verify",)), profiling.timed("argon2"):
+        return password_context().verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    with PASSWORD_HASH_DURATION.time(("hash",)), profiling.timed("argon2"):
+        return password_context().hash(password)
 
 
 def authenticate_user(db: Session, username: str, password: str):
@@ -42,38 +137,66 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": int(time.time())})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
-def get_current_user(
-        credentials: HTTPAuthorizationCredentials = Depends(security),
-        db: Session = Depends(get_db)
-):
-    credentials_exception = HTTPException(
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+
+def decode_access_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     token = credentials.credentials
+    from jose import jwt
 
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
+        raise credentials_exception()
+    if payload.get("sub") is None:
+        raise credentials_exception()
+    return payload
 
-    user = db.query(models.User).filter(models.User.username == username).first()
+
+def get_current_user(
+        payload: dict = Depends(decode_access_token),
+        db: Session = Depends(get_db)
+):
+    user = db.query(models.User).filter(models.User.username == payload["sub"]).first()
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
     return user
 
 
-def get_current_active_user(current_user: schemas.User = Depends(get_current_user)):
+def get_current_active_db_user(current_user: models.User = Depends(get_current_user)):
+    if not current_user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return current_user
+
+
+def user_from_claims(payload: dict, db: Session) -> Optional[schemas.TokenUser]:
+    """Пользователь из подписанных claims токена; None для токенов без uid/active."""
+    if "uid" not in payload or "active" not in payload:
+        return None
+    revocations.sync(db)
+    if revocations.is_revoked(payload["uid"], payload.get("iat", 0)):
+        raise credentials_exception()
+    return schemas.TokenUser(id=payload["uid"], username=payload["sub"], is_active=payload["active"])
+
+
+def get_current_active_user(
+        payload: dict = Depends(decode_access_token),
+        db: Session = Depends(get_db)
+):
+    current_user = user_from_claims(payload, db) if ENV.STATELESS_AUTH else None
+    if current_user is None:
+        current_user = get_current_user(payload, db)
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    return current_user
\ No newline at end of file
+    return current_user
@@ -1,5 +1,12 @@
+import html
+import time
+from datetime import datetime
+
+from sqlalchemy import Integer, bindparam, case, cast, delete, func, select, text, true, union_all, update
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.orm import Session
-from . import models, schemas
+from . import events, models, schemas
+from . import auth
 from .auth import get_password_hash
 
 
@@ -25,26 +32,152 @@ def create_user(db: Session, user: schemas.UserCreate):
     return db_user
 
 
+def set_user_active(db: Session, user_id: int, is_active: bool):
+    """
+    Включить или отключить пользователя. Момент отзыва токенов сохраняется в
+    users.tokens_revoked_at, откуда его подхватывают все процессы
+    (auth.RevocationList.sync); список текущего процесса обновляется сразу.
+    """
+    db_user = db.get(models.User, user_id)
+    if not db_user:
+        return None
+    db_user.is_active = is_active
+    # Токены STATELESS_AUTH несут is_active, поэтому уже выданные нужно отозвать
+    db_user.tokens_revoked_at = None if is_active else int(time.time())
+    db.commit()
+    if not is_active:
+        auth.revocations.revoke(user_id, db_user.tokens_revoked_at)
+    else:
+        auth.revocations.restore(user_id)
+    return db_user
+
+
+def get_items_version(db: Session, user_id: int) -> int:
+    return db.query(models.User.items_version).filter(models.User.id == user_id).scalar() or 0
+
+
 # TodoItem CRUD operations
+def _next_items_version(db: Session, user_id: int, count: int = 1) -> int:
+    """Занять `count` версий задач в текущей транзакции; вернуть последнюю."""
+    return db.execute(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(items_version=models.User.items_version + count)
+        .returning(models.User.items_version)
+    ).scalar_one()
+
+
+def _adjust_summary(db: Session, user_id: int, total: int = 0, completed=0):
+    """Сдвинуть счетчики пользователя в текущей транзакции; `completed` может быть SQL-выражением."""
+    if isinstance(completed, int) and not total and not completed:
+        return
+    stmt = insert(models.TodoSummary).values(
+        owner_id=user_id, total=total, completed=completed
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[models.TodoSummary.owner_id],
+        set_={
+            "total": models.TodoSummary.total + total,
+            "completed": models.TodoSummary.completed + completed,
+        }
+    ))
+
+
+# Пути записи возвращают строки из INSERT/UPDATE/DELETE ... RETURNING: изменение,
+# проверка владельца и чтение результата — один оператор, после коммита ничего
+# не перечитывается.
+TODO_ITEM_COLUMNS = tuple(models.TodoItem.__table__.c)
+# Те же столбцы архивного уровня в том же порядке
+TODO_ITEM_ARCHIVE_COLUMNS = tuple(models.TodoItemArchive.__table__.c[column.name] for column in TODO_ITEM_COLUMNS)
+
+
 def create_todo_item(db: Session, item: schemas.TodoItemCreate, user_id: int):
-    db_item = models.TodoItem(**item.model_dump(), owner_id=user_id)
-    db.add(db_item)
+    db_item = db.execute(
+        insert(models.TodoItem)
+        .values(**item.model_dump(), owner_id=user_id, version=_next_items_version(db, user_id))
+        .returning(*TODO_ITEM_COLUMNS)
+    ).one()
+    _adjust_summary(db, user_id, total=1, completed=int(db_item.completed))
     db.commit()
-    db.refresh(db_item)
+    events.broker.publish(user_id, "create", db_item.version, dict(db_item._mapping))
     return db_item
 
 
-def get_todo_items(db: Session, user_id: int, skip: int = 0, limit: int = 100):
+def bulk_create_todo_items(db: Session, items: list[schemas.TodoItemCreate], user_id: int) -> int:
+    """Вставить пачку задач одним executemany и закоммитить."""
+    if not items:
+        return 0
+    last_version = _next_items_version(db, user_id, count=len(items))
+    first_version = last_version - len(items) + 1
+    db.execute(insert(models.TodoItem), [
+        {**item.model_dump(), "owner_id": user_id, "version": first_version + offset}
+        for offset, item in enumerate(items)
+    ])
+    _adjust_summary(db, user_id, total=len(items), completed=sum(item.completed for item in items))
+    db.commit()
+    # Одно событие на пачку: подписчики забирают задачи из /items/changes
+    events.broker.publish(user_id, "import", last_version, {"count": len(items), "since": first_version - 1})
+    return len(items)
+
+
+def _both_tiers(hot_columns, archive_columns, user_id: int):
+    """Подзапрос по горячим и архивным задачам пользователя."""
+    return union_all(
+        select(*hot_columns).where(models.TodoItem.owner_id == user_id),
+        select(*archive_columns).where(models.TodoItemArchive.owner_id == user_id),
+    ).subquery()
+
+
+def iter_todo_item_batches(db: Session, user_id: int, batch_size: int = 1000):
+    """Все задачи пользователя, включая архивные, пачками простых строк."""
+    items = _both_tiers(TODO_ITEM_COLUMNS, TODO_ITEM_ARCHIVE_COLUMNS, user_id)
+    result = db.execute(
+        select(items)
+        .order_by(items.c.id)
+        .execution_options(yield_per=batch_size)
+    )
+    yield from result.partitions()
+
+
+def get_todo_items(db: Session, user_id: int, skip: int = 0, limit: int = 100, include_archived: bool = False):
+    if include_archived:
+        return get_todo_item_rows(db, user_id, skip=skip, limit=limit, include_archived=True)
     return db.query(models.TodoItem).filter(
         models.TodoItem.owner_id == user_id
     ).offset(skip).limit(limit).all()
 
 
+# Столбцы schemas.TodoItem для чтений, которые кодируются без ORM-объектов
+TODO_ITEM_FIELDS = tuple(getattr(models.TodoItem, name) for name in schemas.TodoItem.model_fields)
+TODO_ITEM_ARCHIVE_FIELDS = tuple(getattr(models.TodoItemArchive, name) for name in schemas.TodoItem.model_fields)
+
+
+def get_todo_item_rows(db: Session, user_id: int, skip: int = 0, limit: int = 100, include_archived: bool = False):
+    if include_archived:
+        items = _both_tiers(TODO_ITEM_FIELDS, TODO_ITEM_ARCHIVE_FIELDS, user_id)
+        return db.execute(
+            select(items).order_by(items.c.id).offset(skip).limit(limit)
+        ).all()
+    return db.execute(
+        select(*TODO_ITEM_FIELDS)
+        .where(models.TodoItem.owner_id == user_id)
+        .offset(skip)
+        .limit(limit)
+    ).all()
+
+
 def get_todo_item(db: Session, item_id: int, user_id: int):
-    return db.query(models.TodoItem).filter(
+    db_item = db.query(models.TodoItem).filter(
         models.TodoItem.id == item_id,
         models.TodoItem.owner_id == user_id
     ).first()
+    if db_item is None:
+        # Поиск по id, поэтому архивные задачи тоже доступны
+        db_item = db.query(models.TodoItemArchive).filter(
+            models.TodoItemArchive.id == item_id,
+            models.TodoItemArchive.owner_id == user_id
+        ).first()
+    return db_item
 
 
 def update_todo_item(
@@ -53,24 +186,318 @@ def update_todo_item(
     item_update: schemas.TodoItemUpdate,
     user_id: int
 ):
-    db_item = get_todo_item(db, item_id, user_id)
-    if not db_item:
-        return None
-
     update_data = item_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(db_item, field, value)
+    db_item = _update_hot_todo_item(db, item_id, update_data, user_id)
+    if db_item is None:
+        db.rollback()
+        # Изменение архивной задачи возвращает ее в горячий уровень
+        if not _unarchive_todo_item(db, item_id, user_id):
+            return None
+        db_item = _update_hot_todo_item(db, item_id, update_data, user_id)
 
     db.commit()
-    db.refresh(db_item)
+    events.broker.publish(user_id, "update", db_item.version, dict(db_item._mapping))
     return db_item
 
 
+def _update_hot_todo_item(db: Session, item_id: int, update_data: dict, user_id: int):
+    owned = (models.TodoItem.id == item_id) & (models.TodoItem.owner_id == user_id)
+
+    if update_data.get("completed") is not None:
+        # Сдвиг счетчика считается по строке до обновления и равен 0,
+        # если задачи нет или completed не меняется
+        delta = select(case(
+            (func.coalesce(models.TodoItem.completed, False) == update_data["completed"], 0),
+            else_=1 if update_data["completed"] else -1
+        )).where(owned).scalar_subquery()
+        _adjust_summary(db, user_id, completed=func.coalesce(delta, 0))
+
+    return db.execute(
+        update(models.TodoItem)
+        .where(owned)
+        .values(**update_data, version=_next_items_version(db, user_id))
+        .returning(*TODO_ITEM_COLUMNS)
+    ).first()
+
+
+def _unarchive_todo_item(db: Session, item_id: int, user_id: int) -> bool:
+    """Вернуть архивную задачу в todo_items в текущей транзакции."""
+    moved = db.execute(
+        delete(models.TodoItemArchive)
+        .where(models.TodoItemArchive.id == item_id, models.TodoItemArchive.owner_id == user_id)
+        .returning(*TODO_ITEM_ARCHIVE_COLUMNS)
+    ).first()
+    if moved is None:
+        db.rollback()
+        return False
+    db.execute(insert(models.TodoItem).values(**moved._mapping))
+    return True
+
+
 def delete_todo_item(db: Session, item_id: int, user_id: int):
-    db_item = get_todo_item(db, item_id, user_id)
-    if not db_item:
+    db_item = db.execute(
+        delete(models.TodoItem)
+        .where(models.TodoItem.id == item_id, models.TodoItem.owner_id == user_id)
+        .returning(models.TodoItem.completed)
+    ).first()
+    if db_item is None:
+        db_item = db.execute(
+            delete(models.TodoItemArchive)
+            .where(models.TodoItemArchive.id == item_id, models.TodoItemArchive.owner_id == user_id)
+            .returning(models.TodoItemArchive.completed)
+        ).first()
+    if db_item is None:
+        db.rollback()
         return False
 
-    db.delete(db_item)
+    version = _next_items_version(db, user_id)
+    db.execute(insert(models.TodoItemTombstone).values(
+        item_id=item_id,
+        owner_id=user_id,
+        version=version
+    ))
+    _adjust_summary(db, user_id, total=-1, completed=-int(bool(db_item.completed)))
+    db.commit()
+    events.broker.publish(user_id, "delete", version, {"item_id": item_id, "version": version})
+    return True
+
+
+def get_todo_summary(db: Session, user_id: int):
+    summary = db.get(models.TodoSummary, user_id)
+    total = summary.total if summary else 0
+    completed = summary.completed if summary else 0
+    return {"total": total, "completed": completed, "pending": total - completed}
+
+
+def reconcile_todo_summaries(db: Session, fix: bool = False):
+    """Пересчитать счетчики по обоим уровням задач; вернуть пользователей с расхождениями."""
+    items = union_all(
+        select(models.TodoItem.owner_id, models.TodoItem.completed),
+        select(models.TodoItemArchive.owner_id, models.TodoItemArchive.completed),
+    ).subquery()
+    actual = {
+        owner_id: (total, completed or 0)
+        for owner_id, total, completed in db.execute(
+            select(items.c.owner_id, func.count(), func.sum(cast(items.c.completed, Integer)))
+            .group_by(items.c.owner_id)
+        )
+    }
+    stored = {
+        summary.owner_id: summary
+        for summary in db.query(models.TodoSummary)
+    }
+
+    drift = []
+    for owner_id in sorted(actual.keys() | stored.keys()):
+        total, completed = actual.get(owner_id, (0, 0))
+        summary = stored.get(owner_id)
+        if summary and (summary.total, summary.completed) == (total, completed):
+            continue
+        if not summary and not total:
+            continue
+        drift.append({
+            "owner_id": owner_id,
+            "stored": (summary.total, summary.completed) if summary else (0, 0),
+            "actual": (total, completed),
+        })
+
+    if fix and drift:
+        # Закрываем читающую транзакцию: счетчики пересчитываются заново в
+        # том же операторе, что их пишет, и запись, сделанная после сверки,
+        # не затирается устаревшими числами
+        db.rollback()
+        db.execute(_RECOUNT_SUMMARY, [{"b_owner_id": row["owner_id"]} for row in drift])
+        db.commit()
+    return drift
+
+
+def _owner_count(model, column=None):
+    counted = func.count() if column is None else func.coalesce(func.sum(cast(column, Integer)), 0)
+    return select(counted).where(model.owner_id == bindparam("b_owner_id")).scalar_subquery()
+
+
+_recount = insert(models.TodoSummary).values(
+    owner_id=bindparam("b_owner_id"),
+    total=_owner_count(models.TodoItem) + _owner_count(models.TodoItemArchive),
+    completed=(_owner_count(models.TodoItem, models.TodoItem.completed)
+               + _owner_count(models.TodoItemArchive, models.TodoItemArchive.completed)),
+)
+_RECOUNT_SUMMARY = _recount.on_conflict_do_update(
+    index_elements=[models.TodoSummary.owner_id],
+    set_={"total": _recount.excluded.total, "completed": _recount.excluded.completed},
+)
+
+
+def get_todo_changes(db: Session, user_id: int, since: int = 0, limit: int = 500):
+    """
+    Задачи обоих уровней и надгробия, записанные после версии `since`, от старых
+    к новым; None, если надгробия новее `since` уже удалены и клиенту нужно
+    начать заново с since=0.
+    """
+    # Курсор читается первым и ограничивает все запросы: все до него уже
+    # закоммичено, поэтому запись между чтениями не может быть пропущена
+    current, pruned = db.query(
+        models.User.items_version, models.User.tombstones_pruned_version
+    ).filter(models.User.id == user_id).first() or (0, 0)
+    if 0 < since < pruned:
+        return None
+    items = db.query(models.TodoItem).filter(
+        models.TodoItem.owner_id == user_id,
+        models.TodoItem.version > since,
+        models.TodoItem.version <= current
+    ).order_by(models.TodoItem.version).limit(limit + 1).all()
+    # Архивирование сохраняет версию задачи: клиент мог ее еще не получить
+    archived = db.query(models.TodoItemArchive).filter(
+        models.TodoItemArchive.owner_id == user_id,
+        models.TodoItemArchive.version > since,
+        models.TodoItemArchive.version <= current
+    ).order_by(models.TodoItemArchive.version).limit(limit + 1).all()
+    tombstones = db.query(models.TodoItemTombstone).filter(
+        models.TodoItemTombstone.owner_id == user_id,
+        models.TodoItemTombstone.version > since,
+        models.TodoItemTombstone.version <= current
+    ).order_by(models.TodoItemTombstone.version).limit(limit + 1).all()
+
+    changes = sorted(items + archived + tombstones, key=lambda change: change.version)
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    if has_more:
+        version = changes[-1].version
+    else:
+        version = current
+
+    return {
+        "version": max(version, since),
+        "has_more": has_more,
+        "items": [c for c in changes if not isinstance(c, models.TodoItemTombstone)],
+        "deleted": [c for c in changes if isinstance(c, models.TodoItemTombstone)],
+    }
+
+
+# Горячий и архивный уровни
+def archive_completed_items(db: Session, completed_before: datetime, batch_size: int = 500) -> int:
+    """
+    Перенести в todo_items_archive одну пачку задач, завершенных и не
+    менявшихся с `completed_before`; вернуть число перенесенных.
+
+    Счетчики продолжают учитывать архивные задачи. items_version владельцев
+    увеличивается, чтобы сменились ETag горячего списка /items/.
+
+    Не работает с таблицей todo_items без AUTOINCREMENT (миграция еще не
+    выполнена): SQLite снова выдал бы id архивных задач.
+    """
+    if models.todo_item_ids_reusable(db.connection()):
+        raise RuntimeError("todo_items may reuse archived ids; run the schema migration before archiving")
+    archivable = (
+        # Литерал 1, а не параметр: так SQLite может использовать частичный индекс
+        (models.TodoItem.completed == true())
+        & (models.TodoItem.updated_at < completed_before)
+    )
+    batch = db.execute(
+        select(models.TodoItem.id, models.TodoItem.owner_id)
+        .where(archivable)
+        .order_by(models.TodoItem.updated_at)
+        .limit(batch_size)
+    ).all()
+    if not batch:
+        return 0
+
+    # Условие повторяется: задачу могли переоткрыть после выборки
+    moving = archivable & models.TodoItem.id.in_([row.id for row in batch])
+    db.execute(
+        insert(models.TodoItemArchive).from_select(
+            [column.name for column in TODO_ITEM_COLUMNS],
+            select(*TODO_ITEM_COLUMNS).where(moving)
+        )
+    )
+    moved = db.execute(delete(models.TodoItem).where(moving)).rowcount
+    for owner_id in sorted({row.owner_id for row in batch}):
+        _next_items_version(db, owner_id)
+    db.commit()
+    return moved
+
+
+def prune_tombstones(db: Session, deleted_before: datetime, batch_size: int = 500) -> int:
+    """
+    Удалить одну пачку надгробий старше `deleted_before`; вернуть их число.
+
+    Сначала tombstones_pruned_version каждого владельца поднимается до самой
+    новой удаляемой версии, чтобы /items/changes распознал курсоры, пропустившие их.
+    """
+    batch = db.execute(
+        select(models.TodoItemTombstone.id, models.TodoItemTombstone.owner_id, models.TodoItemTombstone.version)
+        .where(models.TodoItemTombstone.deleted_at < deleted_before)
+        .order_by(models.TodoItemTombstone.id)
+        .limit(batch_size)
+    ).all()
+    if not batch:
+        return 0
+
+    pruned_versions = {}
+    for row in batch:
+        pruned_versions[row.owner_id] = max(row.version, pruned_versions.get(row.owner_id, 0))
+    for owner_id, version in sorted(pruned_versions.items()):
+        db.execute(
+            update(models.User)
+            .where(models.User.id == owner_id)
+            .values(tombstones_pruned_version=func.max(models.User.tombstones_pruned_version, version))
+        )
+    pruned = db.execute(
+        delete(models.TodoItemTombstone).where(models.TodoItemTombstone.id.in_([row.id for row in batch]))
+    ).rowcount
     db.commit()
-    return True
\ No newline at end of file
+    return pruned
+
+
+# Полнотекстовый поиск
+def _fts_match_expression(query: str) -> str:
+    # Каждое слово в кавычках, чтобы ввод пользователя не разбирался как синтаксис FTS5
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+# snippet() выделяет совпадения управляющими символами, а не <b>: сам текст
+# задачи экранируется, и единственная разметка в *_snippet — наши теги
+_MATCH_OPEN, _MATCH_CLOSE = "\x02", "\x03"
+
+
+def _highlight(snippet):
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(_MATCH_OPEN, "<b>").replace(_MATCH_CLOSE, "</b>")
+
+
+def search_todo_items(db: Session, user_id: int, query: str, skip: int = 0, limit: int = 20):
+    terms = _fts_match_expression(query)
+    if not terms:
+        return []
+
+    rows = db.execute(
+        text(
+            """
+            SELECT t.id, t.title, t.description, t.completed, t.owner_id,
+                   t.version, t.created_at, t.updated_at,
+                   snippet(todo_items_fts, 0, :open, :close, '…', 12) AS title_snippet,
+                   snippet(todo_items_fts, 1, :open, :close, '…', 24) AS description_snippet,
+                   bm25(todo_items_fts, 10.0, 1.0, 0.0) AS rank
+            FROM todo_items_fts
+            JOIN todo_items AS t ON t.id = todo_items_fts.rowid
+            WHERE todo_items_fts MATCH :match
+            ORDER BY rank
+            LIMIT :limit OFFSET :skip
+            """
+        ),
+        {
+            "match": f'owner_id:"{int(user_id)}" AND {{title description}}:({terms})',
+            "limit": limit,
+            "skip": skip,
+            "open": _MATCH_OPEN,
+            "close": _MATCH_CLOSE,
+        },
+    ).mappings().all()
+    return [
+        {**row,
+         "title_snippet": _highlight(row["title_snippet"]),
+         "description_snippet": _highlight(row["description_snippet"])}
+        for row in rows
+    ]
@@ -2,12 +2,17 @@ from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from common import metrics, profiling
+
 from .config import ENV
 
 engine = create_engine(
     ENV.DATABASE_URL,
     connect_args={"check_same_thread": False}
 )
+REGISTRY = metrics.Registry()
+metrics.instrument_engine(engine, REGISTRY)
+profiling.instrument_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
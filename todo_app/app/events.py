@@ -0,0 +1,115 @@
+"""
+Публикация изменений задач подписчикам /items/stream (Server-Sent Events)
+внутри процесса.
+
+У каждого подписчика ограниченный буфер: если клиент не успевает читать,
+он отключается событием overflow и должен догнать состояние через
+/items/changes (id каждого события — версия задачи пользователя).
+"""
+import asyncio
+import json
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+from . import schemas
+
+SUBSCRIBER_BUFFER = 256
+
+
+class Subscriber:
+    """Буфер одного SSE-соединения; заполняется только в его цикле событий."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, buffer_size: int):
+        self.loop = loop
+        self.buffer_size = buffer_size
+        self.dropped = False
+        self._events = deque()
+        self._ready = asyncio.Event()
+
+    def _push(self, event: dict) -> None:
+        if self.dropped:
+            return
+        if len(self._events) >= self.buffer_size:
+            self.dropped = True
+            self._events.clear()
+        else:
+            self._events.append(event)
+        self._ready.set()
+
+    async def next_batch(self, timeout: float) -> Optional[list]:
+        """Накопившиеся события; None, если за timeout ничего не пришло."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._ready.clear()
+        batch = list(self._events)
+        self._events.clear()
+        return batch
+
+
+class Broker:
+    def __init__(self, buffer_size: int = SUBSCRIBER_BUFFER):
+        self.buffer_size = buffer_size
+        self._subscribers: dict[int, set] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: int) -> Subscriber:
+        subscriber = Subscriber(asyncio.get_running_loop(), self.buffer_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, user_id: int, subscriber: Subscriber) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def publish(self, user_id: int, event_type: str, version: int, data: dict) -> None:
+        """Потокобезопасно: пути записи CRUD вызывают его из пула потоков."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        event = {"type": event_type, "version": version, "data": data}
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber._push, event)
+            except RuntimeError:  # the subscriber's loop is already closed
+                self.unsubscribe(user_id, subscriber)
+
+
+broker = Broker()
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def format_event(event: dict) -> str:
+    data = json.dumps(event["data"], ensure_ascii=False, default=_default)
+    return f"id: {event['version']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+def overflow_event(version: int) -> dict:
+    """Клиент переподключается с Last-Event-ID = version и получает пропущенное."""
+    return {"type": "overflow", "version": version, "data": {"since": version}}
+
+
+def replay_events(changes: dict):
+    """События из ответа crud.get_todo_changes, по возрастанию версии."""
+    replayed = [
+        {"type": "update", "version": item.version,
+         "data": schemas.TodoItem.model_validate(item).model_dump()}
+        for item in changes["items"]
+    ] + [
+        {"type": "delete", "version": tombstone.version,
+         "data": {"item_id": tombstone.item_id, "version": tombstone.version}}
+        for tombstone in changes["deleted"]
+    ]
+    return sorted(replayed, key=lambda event: event["version"])
@@ -1,8 +1,14 @@
-from sqlalchemy import Boolean, Column, Integer, String, Text, ForeignKey
+from datetime import datetime
+
+from sqlalchemy import Boolean, Column, DateTime, Integer, String, Text, ForeignKey, Index, event, func, text, update
 from sqlalchemy.orm import relationship
+from sqlalchemy.schema import CreateTable
 
 from .database import Base
 
+# Увеличивать при каждом изменении моделей: при старте миграция идет, только если версия отличается
+SCHEMA_VERSION = 5
+
 
 class User(Base):
     __tablename__ = "users"
@@ -12,6 +18,12 @@ class User(Base):
     email = Column(String(100), unique=True, index=True, nullable=False)
     hashed_password = Column(String(255), nullable=False)
     is_active = Column(Boolean, default=True)
+    # Монотонный счетчик пользователя, растет при каждой записи задачи
+    items_version = Column(Integer, nullable=False, default=0)
+    # Старшая версия среди удаленных надгробий: курсоры старше нее синхронизируются заново
+    tombstones_pruned_version = Column(Integer, nullable=False, default=0)
+    # Unix-время (секунды, как iat) последнего отключения; NULL, пока активен
+    tokens_revoked_at = Column(Integer, nullable=True, index=True)
 
     todo_items = relationship("TodoItem", back_populates="owner")
 
@@ -24,5 +36,199 @@ class TodoItem(Base):
     description = Column(Text, nullable=True)
     completed = Column(Boolean, default=False)
     owner_id = Column(Integer, ForeignKey("users.id"))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = Column(Integer, nullable=False, default=0)
+
+    owner = relationship("User", back_populates="todo_items")
+
+    __table_args__ = (
+        Index("ix_todo_items_owner_version", "owner_id", "version"),
+        # В индексе только завершенные задачи: выборка архиватора остается маленькой
+        Index("ix_todo_items_archivable", "updated_at", sqlite_where=text("completed = 1")),
+        # id архивных задач никогда не выдаются повторно
+        {"sqlite_autoincrement": True},
+    )
+
+
+class TodoItemArchive(Base):
+    """Архивный уровень: завершенные задачи, перенесенные архиватором из todo_items, с теми же id."""
+    __tablename__ = "todo_items_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    title = Column(String(255), nullable=False)
+    description = Column(Text, nullable=True)
+    completed = Column(Boolean, default=False)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    version = Column(Integer, nullable=False, default=0)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_todo_items_archive_owner_id", "owner_id", "id"),
+        # Архивные задачи остаются в ленте изменений
+        Index("ix_todo_items_archive_owner_version", "owner_id", "version"),
+    )
+
+
+class TodoItemTombstone(Base):
+    """След удаленной задачи, по которому клиенты синхронизации узнают об удалении."""
+    __tablename__ = "todo_item_tombstones"
+
+    id = Column(Integer, primary_key=True)
+    item_id = Column(Integer, nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    version = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_todo_item_tombstones_owner_version", "owner_id", "version"),
+    )
+
+
+class TodoSummary(Base):
+    """Счетчики задач пользователя, их поддерживают пути записи CRUD."""
+    __tablename__ = "todo_summaries"
+
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+
+
+# Полнотекстовый индекс по названиям и описаниям задач (SQLite FTS5).
+# Таблица с внешним содержимым: текст хранится только в todo_items, триггеры
+# синхронизируют индекс на всех путях записи. owner_id тоже индексируется,
+# чтобы отбор по пользователю делал индекс, а не фильтрация совпадений.
+TODO_ITEMS_FTS_DDL = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS todo_items_fts USING fts5(
+        title, description, owner_id,
+        content='todo_items', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_items_fts_ai AFTER INSERT ON todo_items BEGIN
+        INSERT INTO todo_items_fts(rowid, title, description, owner_id)
+        VALUES (new.id, new.title, new.description, new.owner_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_items_fts_ad AFTER DELETE ON todo_items BEGIN
+        INSERT INTO todo_items_fts(todo_items_fts, rowid, title, description, owner_id)
+        VALUES ('delete', old.id, old.title, old.description, old.owner_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_items_fts_au
+    AFTER UPDATE OF title, description, owner_id ON todo_items BEGIN
+        INSERT INTO todo_items_fts(todo_items_fts, rowid, title, description, owner_id)
+        VALUES ('delete', old.id, old.title, old.description, old.owner_id);
+        INSERT INTO todo_items_fts(rowid, title, description, owner_id)
+        VALUES (new.id, new.title, new.description, new.owner_id);
+    END
+    """,
+)
+
+
+@event.listens_for(Base.metadata, "after_create")
+def create_todo_items_fts(target, connection, **kw):
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'todo_items_fts'"
+    ).first()
+    for statement in TODO_ITEMS_FTS_DDL:
+        connection.exec_driver_sql(statement)
+    if not exists:
+        # Проиндексировать строки, записанные до появления индекса
+        connection.exec_driver_sql(
+            "INSERT INTO todo_items_fts(todo_items_fts) VALUES ('rebuild')"
+        )
+
+
+@event.listens_for(Base.metadata, "before_drop")
+def drop_todo_items_fts(target, connection, **kw):
+    connection.exec_driver_sql("DROP TABLE IF EXISTS todo_items_fts")
+
+
+def todo_item_ids_reusable(connection) -> bool:
+    """True, если у todo_items нет AUTOINCREMENT: тогда SQLite может повторно выдать id архивных задач."""
+    ddl = connection.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'todo_items'"
+    ).scalar()
+    return ddl is not None and "AUTOINCREMENT" not in ddl.upper()
+
+
+def _rebuild_todo_items(connection):
+    """Пересоздать todo_items по модели (с AUTOINCREMENT), сохранив строки и id."""
+    table = TodoItem.__table__
+    ddl = str(CreateTable(table).compile(dialect=connection.dialect))
+    # Остаток пересборки, прерванной до отката ее транзакции
+    connection.exec_driver_sql("DROP TABLE IF EXISTS todo_items_rebuild")
+    connection.exec_driver_sql(ddl.replace("CREATE TABLE todo_items (", "CREATE TABLE todo_items_rebuild (", 1))
+    columns = ", ".join(column.name for column in table.columns)
+    connection.exec_driver_sql(f"INSERT INTO todo_items_rebuild ({columns}) SELECT {columns} FROM todo_items")
+    # Вместе со старой таблицей удаляются ее индексы и триггеры FTS; rowid не
+    # меняются, поэтому сам индекс FTS остается верным
+    connection.exec_driver_sql("DROP TABLE todo_items")
+    connection.exec_driver_sql("ALTER TABLE todo_items_rebuild RENAME TO todo_items")
+    for index in table.indexes:
+        index.create(connection)
+    for statement in TODO_ITEMS_FTS_DDL:
+        connection.exec_driver_sql(statement)
+
+
+def _backfill_item_versions(connection):
+    """
+    Пронумеровать задачи, записанные до появления версий (version 0), после
+    items_version владельца по возрастанию id и сдвинуть items_version за них,
+    чтобы лента изменений и SSE с since=0 их включали.
+    """
+    for table in ("todo_items", "todo_items_archive"):
+        connection.exec_driver_sql(f"""
+            UPDATE {table} SET version = numbered.version
+            FROM (
+                SELECT items.id, users.items_version
+                    + row_number() OVER (PARTITION BY items.owner_id ORDER BY items.id) AS version
+                FROM {table} AS items JOIN users ON users.id = items.owner_id
+                WHERE items.version = 0
+            ) AS numbered
+            WHERE {table}.id = numbered.id
+        """)
+        connection.exec_driver_sql(f"""
+            UPDATE users SET items_version = max(
+                items_version,
+                coalesce((SELECT max(version) FROM {table} WHERE owner_id = users.id), 0)
+            )
+        """)
+
+
+def _backfill_item_timestamps(connection, now: datetime):
+    """Задачи, записанные до появления created_at/updated_at, получают время миграции."""
+    for table in (TodoItem.__table__, TodoItemArchive.__table__):
+        connection.execute(
+            update(table)
+            .where(table.c.created_at.is_(None) | table.c.updated_at.is_(None))
+            .values(
+                created_at=func.coalesce(table.c.created_at, now),
+                updated_at=func.coalesce(table.c.updated_at, table.c.created_at, now),
+            )
+        )
+
 
-    owner = relationship("User", back_populates="todo_items")
\ No newline at end of file
+def upgrade_schema(connection, from_version):
+    """Шаги migrations.ensure_schema помимо добавления столбцов и таблиц."""
+    if todo_item_ids_reusable(connection):
+        _rebuild_todo_items(connection)
+    _backfill_item_versions(connection)
+    # Иначе старые задачи никогда не попадут под порог updated_at архиватора
+    _backfill_item_timestamps(connection, datetime.utcnow())
+    # id, уже занятые в архиве (он мог появиться до пересборки), повторно не выдаются
+    archived_max = connection.exec_driver_sql("SELECT max(id) FROM todo_items_archive").scalar()
+    if archived_max is not None:
+        seeded = connection.exec_driver_sql(
+            "UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = 'todo_items'", (archived_max,)
+        ).rowcount
+        if not seeded:
+            connection.exec_driver_sql(
+                "INSERT INTO sqlite_sequence (name, seq) VALUES ('todo_items', ?)", (archived_max,)
+            )
@@ -0,0 +1,76 @@
+"""
+NDJSON (одна JSON-запись на строку) для потокового экспорта и импорта задач.
+"""
+import json
+import zlib
+from datetime import datetime
+
+from fastapi import HTTPException, Request
+
+MEDIA_TYPE = "application/x-ndjson"
+# Максимальная длина одной строки импорта, защищает буфер от бесконечной строки
+MAX_LINE_BYTES = 64 * 1024
+# Сколько байт распаковывать за раз из gzip-тела запроса
+DECOMPRESS_CHUNK_BYTES = 256 * 1024
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_rows(rows) -> bytes:
+    return b"".join(
+        json.dumps(dict(row._mapping), ensure_ascii=False, default=_default).encode() + b"\n"
+        for row in rows
+    )
+
+
+def encode_stream(batches, compress: bool = False):
+    """Кодирует пачки строк в NDJSON, при compress=True — в один gzip-поток."""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    for rows in batches:
+        chunk = encode_rows(rows)
+        if compressor:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+    if compressor:
+        yield compressor.flush()
+
+
+async def _iter_body(request: Request):
+    if request.headers.get("content-encoding", "").lower() != "gzip":
+        async for chunk in request.stream():
+            yield chunk
+        return
+
+    decompressor = zlib.decompressobj(wbits=31)
+    try:
+        async for chunk in request.stream():
+            data = decompressor.decompress(chunk, DECOMPRESS_CHUNK_BYTES)
+            while data:
+                yield data
+                data = decompressor.decompress(decompressor.unconsumed_tail, DECOMPRESS_CHUNK_BYTES)
+    except zlib.error:
+        raise HTTPException(status_code=400, detail="Invalid gzip body")
+
+
+async def iter_lines(request: Request):
+    """Непустые строки тела запроса с их номерами, без чтения тела целиком."""
+    buffer = b""
+    line_no = 0
+    async for chunk in _iter_body(request):
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            if len(line) > MAX_LINE_BYTES:
+                raise HTTPException(status_code=413, detail=f"Line {line_no} is too long")
+            if line.strip():
+                yield line_no, line
+        if len(buffer) > MAX_LINE_BYTES:
+            raise HTTPException(status_code=413, detail=f"Line {line_no + 1} is too long")
+    if buffer.strip():
+        yield line_no + 1, buffer
@@ -0,0 +1,36 @@
+"""
+Сверка счетчиков todo_summaries с фактическим содержимым todo_items.
+
+Запуск из каталога todo_app:
+    python -m app.reconcile          # только отчет о расхождениях
+    python -m app.reconcile --fix    # пересчитать расходящиеся счетчики
+"""
+import argparse
+import sys
+
+from .database import SessionLocal
+from . import crud
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Reconcile per-user todo summary counters")
+    parser.add_argument("--fix", action="store_true", help="rewrite drifted counters")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        drift = crud.reconcile_todo_summaries(db, fix=args.fix)
+    finally:
+        db.close()
+
+    for row in drift:
+        print(
+            f"owner_id={row['owner_id']} "
+            f"stored(total, completed)={row['stored']} actual={row['actual']}"
+        )
+    print(f"{len(drift)} drifted summaries{' fixed' if args.fix and drift else ''}")
+    return 1 if drift and not args.fix else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -36,6 +36,13 @@ class TokenData(BaseModel):
     username: Optional[str] = None
 
 
+class TokenUser(BaseModel):
+    """Пользователь, восстановленный из claims токена без обращения к БД."""
+    id: int
+    username: str
+    is_active: bool
+
+
 # TodoItem schemas
 class TodoItemBase(BaseModel):
     title: str
@@ -56,8 +63,42 @@ class TodoItemUpdate(BaseModel):
 class TodoItem(TodoItemBase):
     id: int
     owner_id: int
+    version: int = 0
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class TodoItemSearchResult(TodoItem):
+    title_snippet: str
+    description_snippet: Optional[str] = None
+    rank: float
+
+
+
+class TodoItemTombstone(BaseModel):
+    item_id: int
+    version: int
+    deleted_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class TodoItemChanges(BaseModel):
+    version: int
+    has_more: bool
+    items: list[TodoItem]
+    deleted: list[TodoItemTombstone]
+
+
+class TodoSummary(BaseModel):
+    total: int
+    completed: int
+    pending: int
+
+
+class TodoItemImportResult(BaseModel):
+    imported: int
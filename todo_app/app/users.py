@@ -0,0 +1,36 @@
+"""
+Отключение и включение пользователей из каталога todo_app:
+    python -m app.users deactivate alice
+    python -m app.users activate alice
+
+Отключение сразу отзывает выданные токены: момент отзыва пишется в
+users.tokens_revoked_at, и каждый воркер с STATELESS_AUTH подхватывает его
+не позже чем через ENV.REVOCATION_POLL_SECONDS.
+"""
+import argparse
+import sys
+
+from .database import SessionLocal
+from . import crud
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Deactivate or reactivate a todo user and revoke their tokens")
+    parser.add_argument("action", choices=("deactivate", "activate"))
+    parser.add_argument("username")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        user = crud.get_user_by_username(db, args.username)
+        if user is None:
+            parser.error(f"no such user: {args.username}")
+        crud.set_user_active(db, user.id, args.action == "activate")
+    finally:
+        db.close()
+    print(f"{args.username}: {args.action}d")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())